@@ -3,8 +3,14 @@
 # Миграции
 python manage.py migrate --noinput
 
+# Каталог ингредиентов (повторная загрузка не создаёт дублей)
+python manage.py load_ingredients
+
 # Сбор статики
 python manage.py collectstatic --noinput
 
-# Запуск Gunicorn с правильным модулем
-exec gunicorn foodgramAPI.wsgi:application --bind 0.0.0.0:8000 --workers 3
+# Запуск Gunicorn с правильным модулем. Воркеры gthread обслуживают
+# по 8 запросов сразу, чтобы вход ждал пула хеширования паролей
+# (users/hashing.py) в своём потоке, не занимая весь процесс
+exec gunicorn foodgramAPI.wsgi:application --bind 0.0.0.0:8000 --workers 3 \
+    --worker-class gthread --threads 8
@@ -0,0 +1,216 @@
+"""
+Аутентификация по токену без запроса к базе на каждый вызов API.
+
+Пара токен → пользователь хранится в двух уровнях:
+- LRU в памяти воркера (MAX_ENTRIES записей, TTL секунд);
+- необязательный общий кэш (SHARED_ALIAS из settings.CACHES,
+  SHARED_TTL секунд), чтобы воркеры не ходили в базу по очереди.
+
+Хранится не объект пользователя, а запись его полей без пароля:
+пароль у восстановленного пользователя — отложенное поле и при
+обращении читается из базы.
+
+Отзыв мгновенный для всех воркеров: у пользователя есть версия
+в общем кэше, записи помнят версию, с которой загружены, и каждое
+попадание сверяет её (один запрос к общему кэшу вместо запроса к
+базе). invalidate_token() и invalidate_user() меняют версию сразу
+и повторно после коммита. Записи в пользователя через update()
+(счётчики, версии аватара) тоже должны вызывать invalidate_user().
+Без общего кэша запись в соседнем процессе живёт до TTL; запись,
+прочитанная из базы одновременно со сменой версии, — до SHARED_TTL.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+DEFAULTS = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 5,
+    'SHARED_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+PREFIX = 'auth:token'
+
+
+def auth_cache_options():
+    return {**DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+class LocalTokenCache:
+    """LRU с TTL; общий для потоков воркера"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, cached = entry
+            if expires < time.monotonic():
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return cached
+
+    def set(self, key, cached, ttl, max_entries):
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + ttl, cached)
+            self._keys_by_user.setdefault(cached.user_id, set()).add(key)
+            while len(self._entries) > max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1].user_id
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+
+local_tokens = LocalTokenCache()
+
+
+class CachedUser:
+    """Поля пользователя без пароля и версия, с которой они прочитаны"""
+
+    def __init__(self, user, version):
+        self.user_id = user.pk
+        self.fields = {
+            field.attname: getattr(user, field.attname)
+            for field in type(user)._meta.concrete_fields
+            if field.attname != 'password'
+        }
+        self.version = version
+
+    def restore(self):
+        """Новый экземпляр на каждый запрос: представления меняют его"""
+        model = get_user_model()
+        return model.from_db(
+            router.db_for_read(model),
+            list(self.fields), list(self.fields.values()))
+
+
+def _shared_cache():
+    alias = auth_cache_options()['SHARED_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _token_key(key):
+    return f'{PREFIX}:{key}'
+
+
+def _version_key(user_id):
+    return f'{PREFIX}:version:{user_id}'
+
+
+def _current_version(shared, user_id):
+    """Версия пользователя; None, если общего кэша нет"""
+    if shared is None:
+        return None
+    key = _version_key(user_id)
+    version = shared.get(key)
+    if version is None:
+        shared.add(key, uuid.uuid4().hex, None)
+        version = shared.get(key)
+    return version
+
+
+def _after_commit(function):
+    """Сбросить сразу и повторно после коммита"""
+    function()
+    transaction.on_commit(function)
+
+
+def invalidate_user(user_id):
+    """Профиль, пароль, счётчики или активность пользователя изменились"""
+    def invalidate():
+        local_tokens.delete_user(user_id)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+    _after_commit(invalidate)
+
+
+def invalidate_token(key, user_id):
+    """Токен удалён (выход из системы)"""
+    def invalidate():
+        local_tokens.delete(key)
+        shared = _shared_cache()
+        if shared is not None:
+            shared.delete(_token_key(key))
+
+    _after_commit(invalidate)
+    invalidate_user(user_id)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Замена TokenAuthentication с кэшем токенов"""
+
+    def authenticate_credentials(self, key):
+        options = auth_cache_options()
+        shared = _shared_cache()
+        cached = local_tokens.get(key)
+        from_shared = cached is None and shared is not None
+        if from_shared:
+            cached = shared.get(_token_key(key))
+        if cached is not None and (
+                shared is not None
+                and cached.version != shared.get(
+                    _version_key(cached.user_id))):
+            # Токен отозван или пользователь изменён в другом воркере
+            local_tokens.delete(key)
+            cached = None
+            from_shared = False
+
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            cached = CachedUser(user, _current_version(shared, user.pk))
+            local_tokens.set(
+                key, cached, options['TTL'], options['MAX_ENTRIES'])
+            if shared is not None:
+                shared.set(_token_key(key), cached, options['SHARED_TTL'])
+            return user, token
+        if from_shared:
+            local_tokens.set(
+                key, cached, options['TTL'], options['MAX_ENTRIES'])
+
+        user = cached.restore()
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        # Несохранённый токен: request.auth.key и .user без запроса
+        return user, self.get_model()(key=key, user=user)
@@ -0,0 +1,133 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для list и retrieve.
+
+Валидаторы считаются одним агрегирующим запросом по той же выборке,
+что и ответ (после фильтров): число строк и максимум полей
+updated_fields. В ETag также входят строка запроса, пользователь
+и версия его состояния (избранное, корзина, подписки), от которых
+зависят флаги в ответе. Если валидаторы совпали с If-None-Match /
+If-Modified-Since, сериализация не выполняется и возвращается 304.
+Last-Modified не отражает удаления; точный ответ дают проверки
+по If-None-Match, которые имеют приоритет.
+"""
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def _user_state_key(user_id):
+    return f'conditional:user-state:{user_id}'
+
+
+def user_state(user_id):
+    key = _user_state_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_state(user_id):
+    """Избранное, корзина или подписки пользователя изменились"""
+    cache.set(_user_state_key(user_id), uuid.uuid4().hex, None)
+
+
+class ConditionalGetMixin:
+    """Примесь для ModelViewSet: 304 для list и retrieve"""
+    updated_fields = ('updated_at',)
+    # Число строк ловит удаления; не нужно, если их отражают
+    # версии из get_etag_parts
+    count_rows = True
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            lambda: super(ConditionalGetMixin, self).retrieve(
+                request, *args, **kwargs),
+        )
+
+    def get_etag_parts(self, request):
+        """Дополнительные версии, от которых зависит ответ"""
+        return []
+
+    def filter_queryset(self, queryset):
+        # Выборка, уже отфильтрованная для валидаторов, используется
+        # ответом повторно: фильтры (например, поиск автора) не
+        # выполняют запросы дважды
+        filtered = self.__dict__.pop('_validated_queryset', None)
+        if filtered is not None and filtered.model is queryset.model:
+            return filtered.all()
+        return super().filter_queryset(queryset)
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        self._validated_queryset = queryset
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_validators(self, request):
+        aggregates = {
+            f'last_{field}': Max(field) for field in self.updated_fields}
+        if self.count_rows:
+            aggregates['rows'] = Count('pk')
+        try:
+            meta = self.get_validator_queryset().order_by().aggregate(
+                **aggregates)
+        except (ValueError, DjangoValidationError):
+            # Некорректный id: ответ (404) отдаст обычный обработчик
+            return None, None
+        modified = [
+            meta[f'last_{field}'] for field in self.updated_fields
+            if meta[f'last_{field}'] is not None
+        ]
+        last_modified = max(modified) if modified else None
+        query = urlencode(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        ))
+        user = request.user
+        parts = [
+            request.path, query, meta.get('rows', '-'),
+            *(value.isoformat() for value in modified),
+            user.pk if user.is_authenticated else '-',
+            user_state(user.pk) if user.is_authenticated else '-',
+            *self.get_etag_parts(request),
+        ]
+        etag = hashlib.md5(
+            '|'.join(str(part) for part in parts).encode()).hexdigest()
+        return quote_etag(etag), last_modified
+
+    def conditional_response(self, request, render):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return render()
+        timestamp = (
+            int(last_modified.timestamp()) if last_modified else None)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        patch_vary_headers(response, ['Authorization'])
+        return response
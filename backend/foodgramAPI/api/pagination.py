@@ -0,0 +1,83 @@
+"""
+Подсчёт общего количества объектов для постраничной выдачи.
+
+Точный COUNT(*) на каждый запрос заменяется (settings.PAGINATION_COUNT):
+- для выборок без фильтров на PostgreSQL — оценкой pg_class.reltuples,
+  если таблица достаточно большая, чтобы оценка имела смысл;
+- для остальных — результатом COUNT(*), закэшированным на короткое
+  время по сигнатуре запроса (SQL и параметры).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+DEFAULTS = {
+    'CACHE_TIMEOUT': 15,
+    'ESTIMATE_UNFILTERED': True,
+    'ESTIMATE_THRESHOLD': 10000,
+}
+
+
+def count_options():
+    return {**DEFAULTS, **getattr(settings, 'PAGINATION_COUNT', {})}
+
+
+def estimate_rows(queryset):
+    """Оценка числа строк таблицы по статистике PostgreSQL"""
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else -1
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not query.where and not query.distinct and not query.combinator
+
+
+def get_count(queryset):
+    if not isinstance(queryset, QuerySet):
+        return len(queryset)
+
+    options = count_options()
+    if (
+        options['ESTIMATE_UNFILTERED']
+        and connections[queryset.db].vendor == 'postgresql'
+        and is_unfiltered(queryset)
+    ):
+        estimate = estimate_rows(queryset)
+        if estimate >= options['ESTIMATE_THRESHOLD']:
+            return estimate
+
+    timeout = options['CACHE_TIMEOUT']
+    if not timeout:
+        return queryset.count()
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # Условие заведомо ложно (например, id__in=[])
+        return 0
+    key = 'pagination-count:' + hashlib.md5(
+        f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class CountingPaginator(Paginator):
+    """Paginator Django с приближённым/кэшированным count"""
+
+    @cached_property
+    def count(self):
+        return get_count(self.object_list)
@@ -0,0 +1,194 @@
+"""
+Инструменты тестов: бюджет SQL-запросов на эндпоинт и тестовые данные
+"""
+import os
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+
+from api.authentication import local_tokens
+from recipes.models import (
+    FavoriteRecipe,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartRecipe,
+)
+from recipes import counters, fragments, shopping_list, timeline
+from recipes.catalogue import bump_version
+from users.models import Subscription
+
+User = get_user_model()
+
+PROJECT_ROOT = str(settings.BASE_DIR)
+
+
+def _call_site():
+    """
+    Последний кадр стека из кода проекта; если запрос выполнен целиком
+    библиотекой (например, поиск токена), то ближайший кадр вне django.db
+    """
+    fallback = None
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if 'site-packages' in filename:
+            in_orm = f'{os.sep}django{os.sep}db' in filename
+            if fallback is None and not in_orm:
+                fallback = frame
+            continue
+        if filename.startswith(PROJECT_ROOT) and not filename.endswith(
+                ('tests.py', 'testing.py', 'manage.py')):
+            path = os.path.relpath(filename, PROJECT_ROOT)
+            return f'{path}:{frame.lineno} in {frame.name}'
+    if fallback is None:
+        return '<неизвестно>'
+    path = fallback.filename.split('site-packages' + os.sep)[-1]
+    return f'{path}:{fallback.lineno} in {fallback.name}'
+
+
+class QueryLog:
+    """Журнал запросов с местом вызова в коде проекта"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((_call_site(), sql))
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def report(self):
+        grouped = defaultdict(list)
+        for site, sql in self.queries:
+            grouped[site].append(sql)
+        lines = []
+        for site, statements in sorted(
+                grouped.items(), key=lambda item: -len(item[1])):
+            lines.append(f'{len(statements):>4} × {site}')
+            for sql in dict.fromkeys(statements):
+                lines.append(f'         {sql[:300]}')
+        return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов для тестов API"""
+
+    def setUp(self):
+        super().setUp()
+        # Кэши (счётчики пагинации, ответы и т.п.) не должны переживать тест
+        for backend in caches.all():
+            backend.clear()
+        local_tokens.clear()
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            yield log
+        if len(log) > budget:
+            self.fail(
+                f'Превышен бюджет запросов: {len(log)} > {budget}\n'
+                f'{log.report()}'
+            )
+
+    def count_queries(self, method, url, **kwargs):
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response, log
+
+    def assertFlatQueryCount(self, url, param, sizes=(2, 10, 40)):
+        """
+        Число запросов не растёт вместе с размером страницы.
+        Первый запрос прогревает кэш счётчика пагинации; карточки
+        рецептов каждый раз строятся без кэша фрагментов
+        """
+        separator = '&' if '?' in url else '?'
+        self.client.get(f'{url}{separator}{param}={sizes[0]}')
+        logs = []
+        for size in sizes:
+            fragments.fragment_cache().clear()
+            response, log = self.count_queries(
+                'get', f'{url}{separator}{param}={size}')
+            self.assertEqual(response.status_code, 200, response.data)
+            logs.append(log)
+        if len({len(log) for log in logs}) > 1:
+            self.fail(
+                f'Число запросов {url} зависит от {param}: '
+                f'{[len(log) for log in logs]}\n{logs[-1].report()}'
+            )
+
+
+def seed_dataset(users=60, recipes=300, subscriptions=200,
+                 ingredients=40, ingredients_per_recipe=5):
+    """
+    Заполнение базы реалистичным объёмом данных.
+    Пароли не хешируются, чтобы создание тысяч строк было быстрым.
+    """
+    authors = User.objects.bulk_create([
+        User(
+            email=f'author{number}@example.com',
+            username=f'author{number}',
+            password='!',
+        ) for number in range(users)
+    ])
+    catalogue = Ingredient.objects.bulk_create([
+        Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+        for number in range(ingredients)
+    ])
+    # bulk_create не отправляет сигналы: каталог сбрасывается явно
+    bump_version()
+    recipe_objects = Recipe.objects.bulk_create([
+        Recipe(
+            author=authors[number % users],
+            name=f'Рецепт {number}',
+            text='Описание рецепта',
+            cooking_time=5 + number % 60,
+            image='recipes/images/seed.jpg',
+        ) for number in range(recipes)
+    ])
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe=recipe,
+            ingredient=catalogue[(index + shift) % ingredients],
+            amount=10 + shift,
+        )
+        for index, recipe in enumerate(recipe_objects)
+        for shift in range(ingredients_per_recipe)
+    ])
+    Subscription.objects.bulk_create([
+        Subscription(
+            subscriber=authors[number % users],
+            author=authors[(number % users + 1 + number // users) % users],
+        ) for number in range(subscriptions)
+    ], ignore_conflicts=True)
+    # bulk_create не отправляет сигналы: счётчики пересчитываются явно
+    counters.reconcile()
+    return authors, recipe_objects, catalogue
+
+
+def seed_user_activity(user, authors, recipes, count=50):
+    """Подписки, избранное и список покупок для тестового пользователя"""
+    Subscription.objects.bulk_create([
+        Subscription(subscriber=user, author=author)
+        for author in authors[:count]
+    ])
+    FavoriteRecipe.objects.bulk_create([
+        FavoriteRecipe(user=user, recipe=recipe)
+        for recipe in recipes[:count]
+    ])
+    ShoppingCartRecipe.objects.bulk_create([
+        ShoppingCartRecipe(user=user, recipe=recipe)
+        for recipe in recipes[::len(recipes) // count or 1][:count]
+    ])
+    # Итоги корзины и лента после bulk_create собираются явно
+    shopping_list.rebuild([user.id])
+    timeline.rebuild([user.id])
+    counters.reconcile()
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 # Для задания секретного ключа на случай, если он не указан в .env
 from django.core.management.utils import get_random_secret_key
@@ -89,6 +90,44 @@ DATABASES = {
 }
 
 
+# Хеширование паролей (users/hashing.py, users/hashers.py): алгоритм
+# pbkdf2, scrypt или argon2 и его стоимость. Пароли со старым
+# алгоритмом или стоимостью перехешируются при входе.
+# Хеши считаются в пуле WORKERS потоков; если WORKERS + QUEUE входов
+# через API уже идут дольше WAIT секунд, вход получает 429. Сумма
+# должна быть меньше числа потоков gunicorn (--threads в entrypoint.sh)
+PASSWORD_HASHING = {
+    'ALGORITHM': os.getenv('PASSWORD_HASHER', 'pbkdf2'),
+    'PBKDF2_ITERATIONS': int(
+        os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000)),
+    'SCRYPT_WORK_FACTOR': int(
+        os.getenv('PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14)),
+    'ARGON2_TIME_COST': int(os.getenv('PASSWORD_ARGON2_TIME_COST', 2)),
+    'ARGON2_MEMORY_COST': int(
+        os.getenv('PASSWORD_ARGON2_MEMORY_COST', 102400)),
+    'ARGON2_PARALLELISM': 1,
+    'WORKERS': int(os.getenv('PASSWORD_HASHING_WORKERS', 2)),
+    'QUEUE': int(os.getenv('PASSWORD_HASHING_QUEUE', 4)),
+    'WAIT': 1.0,
+}
+
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'users.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.TunableScryptPasswordHasher',
+    'argon2': 'users.hashers.TunableArgon2PasswordHasher',
+}
+
+# Первый хешер — для новых паролей, остальные проверяют старые хеши
+PASSWORD_HASHERS = [
+    _PASSWORD_HASHERS[PASSWORD_HASHING['ALGORITHM']],
+    *(
+        hasher for name, hasher in _PASSWORD_HASHERS.items()
+        if name != PASSWORD_HASHING['ALGORITHM']
+    ),
+]
+
+AUTHENTICATION_BACKENDS = ['users.backends.PooledHashingBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -131,6 +170,66 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
+# Кэш, общий для всех воркеров gunicorn. В нём лежат ключи, которые
+# читаются на каждом запросе: версии токенов, множества избранного
+# и подписок, число строк для пагинации, версии каталога и теги
+# кэшированных ответов. В продакшене это Redis (infra/docker-compose.yml).
+# Файловый кэш по умолчанию подходит только для разработки: каждый
+# set() перечисляет весь каталог, а при MAX_ENTRIES файлах удаляет
+# 1/CULL_FREQUENCY случайных записей, в том числе теги, по которым
+# evict_recipes находит устаревшие ответы. Поэтому MAX_ENTRIES должен
+# превышать число ключей (около шести на активного пользователя плюс
+# ответы и их теги); цена — перечисление стольких файлов на запись
+FILE_CACHE = 'django.core.cache.backends.filebased.FileBasedCache'
+FILE_CACHE_OPTIONS = {
+    'MAX_ENTRIES': int(os.getenv('FILE_CACHE_MAX_ENTRIES', 50000)),
+    'CULL_FREQUENCY': 10,
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', FILE_CACHE)
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', FILE_CACHE)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+        'OPTIONS': FILE_CACHE_OPTIONS if CACHE_BACKEND == FILE_CACHE else {},
+    },
+    # Кэш анонимных ответов рецептов (recipes/response_cache.py).
+    # Должен быть общим для воркеров: LocMemCache подходит только
+    # для одного процесса
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_responses')
+        ),
+        'OPTIONS': (
+            FILE_CACHE_OPTIONS if RESPONSE_CACHE_BACKEND == FILE_CACHE
+            else {}
+        ),
+    },
+    # Фрагменты карточек рецептов (recipes/fragments.py): ключи
+    # версионированы, поэтому достаточно памяти процесса
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipe-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+RECIPE_RESPONSE_CACHE = {
+    'ALIAS': 'responses',
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60)),
+}
+
+RECIPE_FRAGMENT_CACHE = {
+    'ALIAS': 'fragments',
+    'TIMEOUT': 60 * 60,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -142,7 +241,7 @@ AUTH_USER_MODEL = 'users.CustomUser'
 # Настроим REST framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -151,6 +250,75 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+# Кэш токенов (api/authentication.py): TTL в памяти воркера — предел,
+# на который отозванный токен может пережить выход в соседнем воркере;
+# общий уровень избавляет воркеры от запросов к базе
+TOKEN_AUTH_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': int(os.getenv('TOKEN_AUTH_CACHE_TTL', 5)),
+    'SHARED_ALIAS': 'default',
+    'SHARED_TTL': 300,
+}
+
+# Множество авторов, на которых подписан пользователь
+# (users/following.py): сколько секунд оно живёт в кэше
+FOLLOWING_CACHE = {
+    'TIMEOUT': 60,
+}
+
+# Множества рецептов в избранном и списке покупок пользователя
+# (recipes/marks.py): время жизни в кэше и размер, после которого
+# фильтр использует подзапрос вместо IN (...)
+RECIPE_MARKS = {
+    'TIMEOUT': 5 * 60,
+    'FILTER_LIMIT': 1000,
+}
+
+# Подсчёт общего количества в пагинации (api/pagination.py):
+# COUNT(*) кэшируется на CACHE_TIMEOUT секунд (0 — точный подсчёт),
+# для выборок без фильтров на PostgreSQL берётся оценка reltuples,
+# если в таблице не меньше ESTIMATE_THRESHOLD строк
+PAGINATION_COUNT = {
+    'CACHE_TIMEOUT': int(os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 15)),
+    'ESTIMATE_UNFILTERED': True,
+    'ESTIMATE_THRESHOLD': 10000,
+}
+
+# Рейтинги рецептов (recipes/scores.py): веса событий и периоды
+# полураспада для ?ordering=trending и ?ordering=popular
+RECIPE_SCORES = {
+    'FAVORITE_WEIGHT': 2,
+    'CART_WEIGHT': 1,
+    'HALF_LIFE_HOURS': int(os.getenv('RECIPE_SCORES_HALF_LIFE_HOURS', 72)),
+    'POPULAR_HALF_LIFE_HOURS': int(
+        os.getenv('RECIPE_SCORES_POPULAR_HALF_LIFE_HOURS', 30 * 24)),
+}
+
+# Лента подписок (recipes/timeline.py): рецепты авторов, у которых
+# подписчиков больше FANOUT_LIMIT, не раскладываются по лентам,
+# а читаются при запросе ленты; BACKFILL — сколько последних
+# рецептов автора попадает в ленту при подписке
+RECIPE_FEED = {
+    'FANOUT_LIMIT': int(os.getenv('RECIPE_FEED_FANOUT_LIMIT', 5000)),
+    'BACKFILL': 50,
+}
+
+# Загрузка изображений в base64 (recipes/fields.py): предел размера
+# после декодирования; до SPOOL_SIZE файл декодируется в память,
+# дальше — во временный файл на диске
+IMAGE_UPLOAD = {
+    'MAX_SIZE': int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)),
+    'SPOOL_SIZE': 1024 * 1024,
+}
+
+# Уменьшенные версии фото рецептов и аватаров (recipes/renditions.py):
+# строятся после коммита в пуле потоков (thread) или процессов
+# (process) либо синхронно (sync)
+IMAGE_RENDITIONS = {
+    'EXECUTOR': os.getenv('IMAGE_RENDITIONS_EXECUTOR', 'thread'),
+    'WORKERS': int(os.getenv('IMAGE_RENDITIONS_WORKERS', 2)),
+}
+
 # Настройки djoser
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -159,6 +327,7 @@ DJOSER = {
         'user': 'users.serializers.UserSerializer',
         'current_user': 'users.serializers.UserSerializer',
         'user_create': 'users.serializers.UserCreateSerializer',
+        'token_create': 'users.serializers.UserAuthSerializer',
     },
     'PERMISSIONS': {
         'user': ['rest_framework.permissions.IsAuthenticated'],
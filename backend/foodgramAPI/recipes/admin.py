@@ -1,7 +1,14 @@
 from django.contrib import admin
-from django.db.models import Count
 from django.contrib.admin import SimpleListFilter
-from .models import Ingredient, Recipe, RecipeIngredient, FavoriteRecipe, ShoppingCartRecipe
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    FavoriteRecipe,
+    ShoppingCartRecipe,
+    ShoppingListItem,
+    RecipeScore
+)
 
 # Кастомный фильтр для проверки наличия ингредиентов
 
@@ -52,9 +59,26 @@ class ShoppingCartRecipeAdmin(admin.ModelAdmin):
     autocomplete_fields = ['user', 'recipe']
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "ingredient", "amount")
+    search_fields = ("user__username", "ingredient__name")
+    raw_id_fields = ['user', 'ingredient']
+
+
+@admin.register(RecipeScore)
+class RecipeScoreAdmin(admin.ModelAdmin):
+    list_display = ("recipe", "popular", "trending", "counted_until")
+    ordering = ("-popular",)
+    raw_id_fields = ['recipe']
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author", "cooking_time", "favorites_count")
+    list_display = (
+        "id", "name", "author", "cooking_time",
+        "favorites_count", "in_carts_count"
+    )
     list_filter = ("author", "name", HasIngredientsFilter)
     search_fields = ("name", "author__username")
     inlines = [RecipeIngredientInline]
@@ -71,16 +95,6 @@ class RecipeAdmin(admin.ModelAdmin):
         }),
     )
 
-    # Оптимизация счетчика избранных рецептов
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(favorites_count=Count('favorited_by'))
-
-    def favorites_count(self, obj):
-        return obj.favorites_count
-    favorites_count.admin_order_field = 'favorites_count'
-    favorites_count.short_description = "Добавлено в избранное"
-
 
 @admin.register(FavoriteRecipe)
 class FavoriteRecipeAdmin(admin.ModelAdmin):
@@ -0,0 +1,125 @@
+"""
+Неизменяемый каталог ингредиентов в памяти воркера.
+
+Каталог загружается один раз на процесс и отвечает на список,
+поиск по названию и получение по id без обращения к базе.
+Актуальность проверяется по версии в общем кэше (settings.CACHES):
+любая запись в Ingredient меняет версию, и каждый воркер
+перечитывает каталог при следующем запросе.
+"""
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .filters import INGREDIENT_SEARCH_LIMIT
+from .models import Ingredient
+
+VERSION_KEY = 'ingredients:catalogue-version'
+
+
+class IngredientCatalogue:
+    """
+    Строки отсортированы по названию без учёта регистра.
+    Названия в нижнем регистре склеены в одну строку с массивом
+    смещений: префикс ищется бинарным поиском, подстрока — str.find
+    по склеенной строке, и совпадения сразу идут в порядке сортировки.
+    """
+
+    def __init__(self, version, rows):
+        rows = sorted(rows, key=lambda row: (row[1].casefold(), row[1]))
+        self.version = version
+        self.ids = array('q', (row[0] for row in rows))
+        self.names = tuple(row[1] for row in rows)
+        units = {}
+        self.units = tuple(units.setdefault(row[2], row[2]) for row in rows)
+        self.folded = tuple(name.casefold() for name in self.names)
+        self.haystack = '\n'.join(self.folded)
+        self.offsets = array('q')
+        position = 0
+        for name in self.folded:
+            self.offsets.append(position)
+            position += len(name) + 1
+        self.positions_by_id = {
+            ingredient_id: index
+            for index, ingredient_id in enumerate(self.ids)
+        }
+
+    @classmethod
+    def load(cls, version):
+        return cls(version, Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').order_by().iterator())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _item(self, index):
+        return {
+            'id': self.ids[index],
+            'name': self.names[index],
+            'measurement_unit': self.units[index],
+        }
+
+    def all(self):
+        return [self._item(index) for index in range(len(self))]
+
+    def get(self, ingredient_id):
+        index = self.positions_by_id.get(ingredient_id)
+        return None if index is None else self._item(index)
+
+    def _prefix_rows(self, term):
+        start = bisect_left(self.folded, term)
+        for index in range(start, len(self)):
+            if not self.folded[index].startswith(term):
+                return
+            yield index
+
+    def _substring_rows(self, term):
+        position = self.haystack.find(term)
+        while position != -1:
+            index = bisect_right(self.offsets, position) - 1
+            if position != self.offsets[index]:
+                yield index
+            # Следующее совпадение ищем со следующей строки
+            if index + 1 == len(self):
+                return
+            position = self.haystack.find(term, self.offsets[index + 1])
+
+    def search(self, term, limit=INGREDIENT_SEARCH_LIMIT):
+        """Как search_ingredients: сначала префиксные совпадения"""
+        term = term.casefold().replace('\n', ' ')
+        found = []
+        for rows in (self._prefix_rows(term), self._substring_rows(term)):
+            for index in rows:
+                if len(found) == limit:
+                    return found
+                found.append(self._item(index))
+        return found
+
+
+_catalogue = None
+
+
+def bump_version():
+    """
+    Сменить версию каталога. Вызывается сразу и повторно после коммита,
+    чтобы воркер не успел закэшировать ещё не видимые изменения
+    """
+    def new_version():
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+    new_version()
+    transaction.on_commit(new_version)
+
+
+def get_catalogue():
+    global _catalogue
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    if _catalogue is None or _catalogue.version != version:
+        _catalogue = IngredientCatalogue.load(version)
+    return _catalogue
@@ -0,0 +1,72 @@
+"""
+Денормализованные счётчики рецептов и пользователей.
+
+Recipe.favorites_count, Recipe.in_carts_count, CustomUser.recipes_count
+и CustomUser.subscribers_count меняются атомарным UPDATE ... SET
+field = field ± 1 из сигналов создания и удаления связанных строк.
+reconcile() пересчитывает их по живым данным и исправляет расхождения.
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.authentication import invalidate_user
+from users.models import Subscription
+
+from .models import FavoriteRecipe, Recipe, ShoppingCartRecipe
+
+User = get_user_model()
+
+# (модель со счётчиком, поле, связанная модель, внешний ключ на модель)
+COUNTERS = [
+    (Recipe, 'favorites_count', FavoriteRecipe, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCartRecipe, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+]
+
+
+def increment(model, pk, field, delta=1):
+    """Атомарно изменить счётчик; ниже нуля он не опускается"""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+    if model is User:
+        # update() мимо сигналов: кэш токенов хранит счётчики
+        invalidate_user(pk)
+
+
+def live_count(related, foreign_key):
+    return Coalesce(Subquery(
+        related.objects.filter(**{foreign_key: OuterRef('pk')})
+        .order_by()
+        .values(foreign_key)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def drift():
+    """Расхождения: [(модель, pk, поле, в столбце, по данным)]"""
+    mismatches = []
+    for model, field, related, foreign_key in COUNTERS:
+        rows = model.objects.annotate(
+            live=live_count(related, foreign_key)
+        ).exclude(**{field: F('live')}).values_list('pk', field, 'live')
+        mismatches.extend(
+            (model, pk, field, stored, live) for pk, stored, live in rows)
+    return mismatches
+
+
+def reconcile():
+    """Исправить расхождения одним UPDATE на счётчик; вернуть число строк"""
+    updated = 0
+    for model, field, related, foreign_key in COUNTERS:
+        expression = live_count(related, foreign_key)
+        queryset = model.objects.exclude(**{field: expression})
+        if model is User:
+            for pk in queryset.values_list('pk', flat=True):
+                invalidate_user(pk)
+        updated += queryset.update(**{field: expression})
+    return updated
@@ -0,0 +1,159 @@
+"""
+Потоковая выгрузка списка покупок в форматах txt, csv и pdf.
+
+Каждый экспортер принимает итератор строк агрегата
+(название, единица измерения, количество) и отдаёт куски файла
+по мере чтения курсора, не собирая документ целиком в памяти.
+"""
+import csv
+from itertools import chain
+
+TITLE = 'Список покупок:'
+
+
+def _line(name, unit, amount):
+    return f'{name} ({unit}) — {amount}'
+
+
+def text_chunks(rows):
+    yield f'{TITLE}\n\n'
+    for row in rows:
+        yield _line(*row) + '\n'
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(['Ингредиент', 'Единица измерения', 'Количество'])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+# Параметры страницы A4 в пунктах
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 12
+PDF_LEADING = 16
+PDF_LINES_PER_PAGE = (PDF_PAGE_HEIGHT - 2 * PDF_MARGIN) // PDF_LEADING
+
+
+def _cyrillic_differences():
+    """
+    Глифы кириллицы для кодов cp1251: стандартный шрифт Helvetica
+    не встраивается, поэтому имена глифов задаются через /Differences
+    """
+    names = ['168 /afii10023', '184 /afii10071', '192']
+    upper = [10017 + i + (i >= 6) for i in range(32)]
+    lower = [10065 + i + (i >= 6) for i in range(32)]
+    names.extend(f'/afii{code}' for code in upper + lower)
+    return ' '.join(names).encode()
+
+
+PDF_FONT = (
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+    b'/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+    b'/Differences [' + _cyrillic_differences() + b'] >> >>'
+)
+
+
+def _pdf_string(text):
+    encoded = text.encode('cp1251', errors='replace')
+    return (
+        encoded.replace(b'\\', b'\\\\')
+        .replace(b'(', b'\\(')
+        .replace(b')', b'\\)')
+    )
+
+
+class _PdfWriter:
+    """Запись объектов PDF с учётом смещений для таблицы xref"""
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+
+    def raw(self, data):
+        self.position += len(data)
+        return data
+
+    def object(self, number, body):
+        self.offsets[number] = self.position
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, data):
+        return self.object(
+            number,
+            b'<< /Length %d >>\nstream\n%s\nendstream' % (len(data), data)
+        )
+
+    def page(self, number, contents):
+        return self.object(number, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+        ) % (PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, contents))
+
+
+def _pdf_pages(lines):
+    page = []
+    for line in lines:
+        page.append(line)
+        if len(page) == PDF_LINES_PER_PAGE:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def pdf_chunks(rows):
+    """
+    PDF пишется постранично: страницы идут в поток сразу,
+    дерево страниц, каталог и xref добавляются в конце файла
+    """
+    writer = _PdfWriter()
+    yield writer.raw(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    yield writer.object(3, PDF_FONT)
+
+    lines = chain([TITLE, ''], (_line(*row) for row in rows))
+    kids = []
+    number = 4
+    for page in _pdf_pages(lines):
+        content = b'BT /F1 %d Tf %d TL %d %d Td\n' % (
+            PDF_FONT_SIZE, PDF_LEADING,
+            PDF_MARGIN, PDF_PAGE_HEIGHT - PDF_MARGIN,
+        )
+        content += b''.join(
+            b"(%s) '\n" % _pdf_string(line) for line in page)
+        content += b'ET'
+        yield writer.stream(number, content)
+        yield writer.page(number + 1, number)
+        kids.append(number + 1)
+        number += 2
+
+    yield writer.object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        b' '.join(b'%d 0 R' % kid for kid in kids), len(kids)))
+    yield writer.object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    xref_position = writer.position
+    size = number
+    xref = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+    xref.extend(
+        b'%010d 00000 n \n' % writer.offsets[obj] for obj in range(1, size))
+    yield writer.raw(b''.join(xref))
+    yield writer.raw(
+        b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (size, xref_position)
+    )
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', text_chunks),
+    'csv': ('text/csv; charset=utf-8', csv_chunks),
+    'pdf': ('application/pdf', pdf_chunks),
+}
@@ -1,11 +1,120 @@
 # recipes/fields.py
 
 from rest_framework import serializers
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.uploadedfile import UploadedFile
 import base64
-import imghdr
+import binascii
+import tempfile
 import uuid
 
+DEFAULTS = {
+    # Предел размера после декодирования (nginx: client_max_body_size 10M)
+    'MAX_SIZE': 10 * 1024 * 1024,
+    # До этого размера декодированный файл держится в памяти
+    'SPOOL_SIZE': 1024 * 1024,
+    # Символов строки за шаг декодирования
+    'CHUNK': 64 * 1024,
+}
+
+# Байтов, по которым определяется формат (RIFF....WEBP — 12)
+SIGNATURE_SIZE = 12
+
+# Сигнатуры в начале файла и расширение, под которым он сохраняется
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def upload_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_UPLOAD', {})}
+
+
+def _image_extension(head):
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    raise serializers.ValidationError("Формат изображения не поддерживается")
+
+
+def _base64_pieces(data, start, size):
+    """
+    Части data[start:] без пробельных символов (base64 в формате MIME
+    разбит на строки), длиной кратной 4; остаток переносится в
+    следующую часть. Неполный хвост отдаётся как есть — его отвергнет
+    b64decode
+    """
+    carry = ''
+    for offset in range(start, len(data), size):
+        piece = carry + ''.join(data[offset:offset + size].split())
+        cut = len(piece) // 4 * 4
+        carry = piece[cut:]
+        if cut:
+            yield piece[:cut]
+    if carry:
+        yield carry
+
+
+def decode_base64_image(data):
+    """
+    Декодировать data:image/...;base64,... по частям во временный файл.
+    Размер проверяется по длине строки до декодирования, формат — по
+    первым SIGNATURE_SIZE байтам; в памяти не бывает полной копии байтов
+    """
+    options = upload_options()
+    if options['CHUNK'] < 1:
+        raise ImproperlyConfigured('IMAGE_UPLOAD["CHUNK"] должен быть >= 1')
+    if not isinstance(data, str) or not data.startswith('data:image'):
+        raise serializers.ValidationError("Некорректный формат изображения")
+    start = data.find(';base64,')
+    if start == -1:
+        raise serializers.ValidationError("Некорректный формат изображения")
+    start += len(';base64,')
+
+    length = len(data) - start - sum(
+        data.count(space, start) for space in ' \t\r\n')
+    stripped = data.rstrip()
+    padding = len(stripped) - len(stripped.rstrip('='))
+    if length * 3 // 4 - padding > options['MAX_SIZE']:
+        raise serializers.ValidationError(
+            "Размер изображения превышает "
+            f"{options['MAX_SIZE'] // (1024 * 1024)} МБ")
+
+    target = tempfile.SpooledTemporaryFile(max_size=options['SPOOL_SIZE'])
+    # Начало файла копится, пока не наберётся SIGNATURE_SIZE байт
+    head = b''
+    extension = None
+    try:
+        for piece in _base64_pieces(data, start, options['CHUNK']):
+            decoded = base64.b64decode(piece, validate=True)
+            if extension is None:
+                head += decoded
+                if len(head) < SIGNATURE_SIZE:
+                    continue
+                extension = _image_extension(head)
+                decoded, head = head, b''
+            target.write(decoded)
+        if extension is None:
+            if not head:
+                raise serializers.ValidationError("Пустое изображение")
+            extension = _image_extension(head)
+            target.write(head)
+    except binascii.Error:
+        target.close()
+        raise serializers.ValidationError("Некорректные данные base64")
+    except serializers.ValidationError:
+        target.close()
+        raise
+    target.seek(0)
+    return File(target, name=f"{uuid.uuid4()}.{extension}")
+
 
 class ImageDataField(serializers.Field):
     """
@@ -18,21 +127,6 @@ class ImageDataField(serializers.Field):
         return value.url
 
     def to_internal_value(self, data):
-        from django.core.files.uploadedfile import UploadedFile
-
         if isinstance(data, UploadedFile):
             return data
-
-        if isinstance(data, str) and data.startswith('data:image'):
-            header, imgstr = data.split(';base64,')
-            ext = imghdr.what('', imgstr)
-            if ext not in ('png', 'jpg', 'jpeg', 'gif'):
-                raise serializers.ValidationError(
-                    "Формат изображения не поддерживается")
-            data = ContentFile(
-                base64.b64decode(imgstr),
-                name=f"{uuid.uuid4()}.{ext}"
-            )
-            return data
-
-        raise serializers.ValidationError("Некорректный формат изображения")
+        return decode_base64_image(data)
@@ -1,6 +1,25 @@
+from django.db.models import Case, Value, When
 from django_filters import rest_framework as filters
-from django.db.models import Exists, OuterRef
-from .models import Recipe, Ingredient, FavoriteRecipe, ShoppingCartRecipe
+from . import marks
+from .models import Recipe, Ingredient
+from .scores import order_by_score
+
+# Сколько ингредиентов отдаёт поиск для автодополнения
+INGREDIENT_SEARCH_LIMIT = 50
+
+
+def search_ingredients(queryset, value, limit=INGREDIENT_SEARCH_LIMIT):
+    """
+    Поиск по названию: совпадения с начала строки идут раньше
+    совпадений по подстроке. На PostgreSQL оба условия обслуживает
+    триграммный GIN-индекс по UPPER(name) (миграция 0006)
+    """
+    return queryset.filter(name__icontains=value).annotate(
+        prefix_rank=Case(
+            When(name__istartswith=value, then=Value(0)),
+            default=Value(1),
+        )
+    ).order_by('prefix_rank', 'name')[:limit]
 
 
 class RecipeFilter(filters.FilterSet):
@@ -9,39 +28,56 @@ class RecipeFilter(filters.FilterSet):
     - По автору
     - По наличию в избранном
     - По наличию в списке покупок
+    - Сортировка по рейтингу (ordering=popular|trending)
     """
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Популярные'), ('trending', 'Набирающие')),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'author', 'is_favorited', 'is_in_shopping_cart', 'ordering'
+        ]
 
     def filter_is_favorited(self, queryset, name, value):
         """
         Фильтрация рецептов по наличию в избранном у текущего пользователя
         """
-        user = self.request.user
-        if user.is_authenticated and value:
-            return queryset.filter(favorited_by__user=user)
+        if self.request.user.is_authenticated:
+            return marks.filter_marked(
+                queryset, self.request, marks.FAVORITES, value)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         """
         Фильтрация рецептов по наличию в списке покупок у текущего пользователя
         """
-        user = self.request.user
-        if user.is_authenticated and value:
-            return queryset.filter(shopping_cart_recipes__user=user)
+        if self.request.user.is_authenticated:
+            return marks.filter_marked(
+                queryset, self.request, marks.CART, value)
         return queryset
 
+    def filter_ordering(self, queryset, name, value):
+        """
+        Порядок по предрасчитанному рейтингу (RecipeScore), без агрегации
+        в запросе. В выдаче по курсору (?cursor=) не применяется
+        """
+        return order_by_score(queryset, value)
+
 
 class IngredientFilter(filters.FilterSet):
     """Фильтр для ингредиентов"""
-    name = filters.CharFilter(
-        lookup_expr='icontains')  # Пример фильтрации по имени
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ['name']  # Добавьте поля, по которым нужно фильтровать
+
+    def filter_name(self, queryset, name, value):
+        """Ранжированный поиск для автодополнения"""
+        return search_ingredients(queryset, value)
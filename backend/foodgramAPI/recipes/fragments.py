@@ -0,0 +1,53 @@
+"""
+Кэш общей для всех пользователей части карточки рецепта.
+
+Фрагмент — вывод RecipeReadSerializer целиком; флаги избранного,
+списка покупок и подписки на автора подставляются при каждом выводе.
+Ключ включает версию всего, что попадает во фрагмент: updated_at
+рецепта, поля автора, версию каталога ингредиентов и хост запроса
+(URL аватара абсолютный). Устаревший фрагмент поэтому никогда
+не читается, и кэш не нужно сбрасывать — даже локальный для процесса.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .catalogue import VERSION_KEY
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+}
+
+# Поля автора, которые выводятся во фрагменте
+AUTHOR_FIELDS = (
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_renditions',
+)
+
+
+def fragment_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_FRAGMENT_CACHE', {})}
+
+
+def fragment_cache():
+    return caches[fragment_options()['ALIAS']]
+
+
+def context_version(request):
+    """Общая для всех рецептов часть ключа"""
+    host = f'{request.scheme}://{request.get_host()}' if request else ''
+    return f'{host}|{cache.get(VERSION_KEY)}'
+
+
+def fragment_key(recipe, version):
+    author = recipe.author
+    signature = '|'.join([
+        version,
+        str(recipe.pk),
+        recipe.updated_at.isoformat(),
+        str(author.pk),
+        *(str(getattr(author, field)) for field in AUTHOR_FIELDS),
+    ])
+    return f'recipes:fragment:{hashlib.md5(signature.encode()).hexdigest()}'
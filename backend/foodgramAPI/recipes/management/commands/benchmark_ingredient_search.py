@@ -0,0 +1,83 @@
+import csv
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.catalogue import IngredientCatalogue
+from recipes.filters import search_ingredients
+from recipes.models import Ingredient
+
+DEFAULT_TERMS = ['абр', 'сол', 'молоко', 'ова', 'сыр']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает поиск ингредиентов (icontains без ранжирования и '
+        'ранжированный поиск с лимитом, каталог в памяти) на данных, '
+        'размноженных в N раз. '
+        'Все данные создаются в транзакции, которая откатывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.csv'),
+            help='CSV-файл каталога (название,единица)',
+        )
+        parser.add_argument('--scale', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--term', action='append', dest='terms',
+            help='Поисковая строка (можно повторять)',
+        )
+
+    def handle(self, *args, path, scale, repeat, terms, **options):
+        with open(path, encoding='utf-8') as source:
+            catalogue = [row for row in csv.reader(source) if len(row) == 2]
+
+        with transaction.atomic():
+            Ingredient.objects.bulk_create([
+                Ingredient(
+                    name=f'{name} {copy}' if copy else name,
+                    measurement_unit=unit,
+                )
+                for copy in range(scale)
+                for name, unit in catalogue
+            ], batch_size=5000, ignore_conflicts=True)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE recipes_ingredient')
+            total = Ingredient.objects.count()
+            self.stdout.write(f'Ингредиентов в каталоге: {total}')
+
+            queryset = Ingredient.objects.all()
+            catalogue = IngredientCatalogue.load(version=None)
+            for term in terms or DEFAULT_TERMS:
+                plain = self._measure(
+                    lambda: list(queryset.filter(name__icontains=term)),
+                    repeat,
+                )
+                ranked = self._measure(
+                    lambda: list(search_ingredients(queryset, term)),
+                    repeat,
+                )
+                in_memory = self._measure(
+                    lambda: catalogue.search(term), repeat)
+                self.stdout.write(
+                    f'{term!r}: icontains {plain:.2f} мс, '
+                    f'ранжированный с лимитом {ranked:.2f} мс, '
+                    f'каталог в памяти {in_memory:.3f} мс'
+                )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(query, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
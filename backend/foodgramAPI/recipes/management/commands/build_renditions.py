@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import renditions
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные версии фото рецептов и аватаров, которых '
+        'ещё нет. Нужна после первого развёртывания и смены '
+        'IMAGE_RENDITIONS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить версии всех изображений',
+        )
+
+    def handle(self, *args, force=False, **options):
+        started = time.perf_counter()
+        built = renditions.backfill(force=force)
+        self.stdout.write(
+            f'Обработано изображений: {built} '
+            f'за {time.perf_counter() - started:.2f} с'
+        )
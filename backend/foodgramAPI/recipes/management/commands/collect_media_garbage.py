@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT фото, аватары и их уменьшенные версии, '
+        'на которые не ссылается ни один объект. Запускается '
+        'периодически (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только вывести файлы, которые будут удалены',
+        )
+
+    def handle(self, *args, min_age=3600, dry_run=False, **options):
+        removed = collect_garbage(min_age=min_age, dry_run=dry_run)
+        for name in removed:
+            self.stdout.write(name)
+        verb = 'К удалению' if dry_run else 'Удалено'
+        self.stdout.write(f'{verb} файлов: {len(removed)}')
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинги рецептов для ?ordering=popular|trending '
+        'по событиям избранного и списков покупок с прошлого запуска. '
+        'Запускается периодически (cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать рейтинги по всем событиям',
+        )
+
+    def handle(self, *args, full=False, **options):
+        started = time.perf_counter()
+        touched = scores.refresh(full=full)
+        self.stdout.write(
+            f'Обновлено рейтингов: {touched} '
+            f'за {time.perf_counter() - started:.2f} с'
+        )
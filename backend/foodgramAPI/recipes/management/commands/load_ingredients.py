@@ -0,0 +1,193 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.catalogue import bump_version
+from recipes.models import Ingredient
+
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+STAGING_TABLE = 'ingredient_staging'
+
+
+def read_csv(source):
+    for row in csv.reader(source):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def _json_row(item, index):
+    """(название, единица) из элемента массива; CommandError с номером"""
+    if not isinstance(item, dict):
+        raise CommandError(f'Элемент {index}: ожидался объект')
+    row = []
+    for field in ('name', 'measurement_unit'):
+        value = item.get(field)
+        if not isinstance(value, str):
+            raise CommandError(
+                f'Элемент {index}: поле {field} должно быть строкой')
+        row.append(value)
+    return tuple(row)
+
+
+def read_json(source, buffer_size=1 << 16):
+    """
+    Потоковое чтение JSON-массива объектов {name, measurement_unit}:
+    объекты разбираются по одному, файл целиком в память не читается.
+    Элементы нумеруются с 1
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    index = 0
+    while True:
+        chunk = source.read(buffer_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался JSON-массив')
+                started = True
+                position += 1
+                continue
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            index += 1
+            yield _json_row(item, index)
+        if not chunk:
+            if buffer[position:].strip():
+                raise CommandError('Некорректный JSON в конце файла')
+            return
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+class BulkCreateLoader:
+    """Загрузка для баз без COPY: bulk_create с пропуском дублей"""
+
+    def load(self, rows):
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=unit)
+             for name, unit in rows],
+            ignore_conflicts=True,
+        )
+
+    def finish(self):
+        pass
+
+
+class CopyLoader:
+    """
+    PostgreSQL: каждая пачка уходит через COPY во временную таблицу,
+    в конце одна вставка с ON CONFLICT по unique_ingredient_with_unit
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.cursor.execute(
+            f'CREATE TEMP TABLE {STAGING_TABLE} '
+            f'(name varchar({NAME_LENGTH}), '
+            f'measurement_unit varchar({UNIT_LENGTH})) '
+            'ON COMMIT DROP'
+        )
+
+    def load(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        self.cursor.copy_expert(
+            f'COPY {STAGING_TABLE} (name, measurement_unit) '
+            'FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+
+    def finish(self):
+        self.cursor.execute(
+            f'INSERT INTO {Ingredient._meta.db_table} '
+            '(name, measurement_unit) '
+            f'SELECT DISTINCT name, measurement_unit FROM {STAGING_TABLE} '
+            'ON CONFLICT ON CONSTRAINT unique_ingredient_with_unit '
+            'DO NOTHING'
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV (название,единица) или JSON. '
+        'Повторный запуск не создаёт дублей'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=[str(settings.BASE_DIR / 'data' / 'ingredients.csv')],
+        )
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, paths, chunk_size, **options):
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        read = skipped = 0
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            loader = (
+                CopyLoader(cursor) if connection.vendor == 'postgresql'
+                else BulkCreateLoader()
+            )
+            for path in paths:
+                reader = READERS.get(os.path.splitext(path)[1].lower())
+                if reader is None:
+                    raise CommandError(f'Неизвестный формат: {path}')
+                with open(path, encoding='utf-8') as source:
+                    try:
+                        for chunk in chunked(reader(source), chunk_size):
+                            rows = self._clean(chunk)
+                            read += len(chunk)
+                            skipped += len(chunk) - len(rows)
+                            loader.load(rows)
+                    except CommandError as error:
+                        raise CommandError(f'{path}: {error}') from error
+            loader.finish()
+
+        added = Ingredient.objects.count() - before
+        if added:
+            bump_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Прочитано {read}, добавлено {added}, пропущено {skipped} '
+            f'за {elapsed:.2f} с ({read / elapsed:.0f} строк/с)'
+        )
+
+    @staticmethod
+    def _clean(chunk):
+        rows = []
+        for name, unit in chunk:
+            name, unit = name.strip(), unit.strip()
+            if name and unit and len(name) <= NAME_LENGTH and (
+                    len(unit) <= UNIT_LENGTH):
+                rows.append((name, unit))
+        return rows
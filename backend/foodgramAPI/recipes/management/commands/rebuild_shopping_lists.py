@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает итоги списков покупок из корзин '
+        'и сверяет их с живой агрегацией'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу, ничего не меняя',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничиться пользователем (можно повторять)',
+        )
+
+    def handle(self, *args, check=False, user_ids=None, **options):
+        if not check:
+            rows = shopping_list.rebuild(user_ids)
+            self.stdout.write(f'Пересобрано строк: {rows}')
+
+        mismatches = shopping_list.verify(user_ids)
+        for (user_id, ingredient_id), (stored, live) in sorted(
+                mismatches.items()):
+            self.stderr.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'в таблице {stored}, в корзине {live}'
+            )
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Итоги совпадают с корзинами'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок из подписок и рецептов. '
+        'Нужна после первого развёртывания ленты и смены RECIPE_FEED'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Ограничиться пользователем (можно повторять)',
+        )
+
+    def handle(self, *args, user_ids=None, **options):
+        rows = timeline.rebuild(user_ids)
+        self.stdout.write(f'Записей в лентах: {rows}')
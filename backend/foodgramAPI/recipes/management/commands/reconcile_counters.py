@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного, списков покупок, рецептов '
+        'и подписчиков с данными и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счётчики, ничего не меняя',
+        )
+
+    def handle(self, *args, check=False, **options):
+        mismatches = counters.drift()
+        for model, pk, field, stored, live in mismatches:
+            self.stderr.write(
+                f'{model._meta.label} id={pk} {field}: '
+                f'в столбце {stored}, по данным {live}'
+            )
+        if check:
+            if mismatches:
+                raise CommandError(f'Расхождений: {len(mismatches)}')
+        elif mismatches:
+            self.stdout.write(f'Исправлено строк: {counters.reconcile()}')
+        self.stdout.write(self.style.SUCCESS('Счётчики совпадают с данными'))
@@ -0,0 +1,105 @@
+"""
+Множества id рецептов в избранном и в списке покупок пользователя.
+
+В кэше множество хранится отсортированным массивом array('q')
+(8 байт на рецепт), в запросе — frozenset, загруженный один раз
+на запрос. Флаги is_favorite / is_in_shopping_cart и фильтры
+?is_favorited / ?is_in_shopping_cart отвечают по нему без обращения
+к FavoriteRecipe / ShoppingCartRecipe. Повторное добавление отсекает
+сама вставка (toggles.py).
+
+Массив в кэше не правится на месте: сигналы добавления и удаления
+удаляют его после коммита, и следующее чтение загружает множество
+заново одним запросом. Одновременные изменения не теряются, а откат
+транзакции не оставляет в кэше рецепт, которого нет в базе.
+"""
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Value
+
+from .models import FavoriteRecipe, ShoppingCartRecipe
+
+DEFAULTS = {
+    'TIMEOUT': 5 * 60,
+    # Больше стольких id фильтр строит подзапрос, а не IN (...)
+    'FILTER_LIMIT': 1000,
+}
+
+FAVORITES = 'favorites'
+CART = 'cart'
+
+MODELS = {
+    FAVORITES: FavoriteRecipe,
+    CART: ShoppingCartRecipe,
+}
+
+
+def marks_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_MARKS', {})}
+
+
+def _cache_key(kind, user_id):
+    return f'recipes:marks:{kind}:{user_id}'
+
+
+def _load(user_id):
+    """
+    Оба множества пользователя: одно обращение к кэшу и не больше
+    одного запроса (UNION) для отсутствующих в нём
+    """
+    keys = {kind: _cache_key(kind, user_id) for kind in MODELS}
+    cached = cache.get_many(keys.values())
+    missing = [kind for kind in MODELS if keys[kind] not in cached]
+    if missing:
+        loaded = {kind: [] for kind in missing}
+        queries = [
+            MODELS[kind].objects.filter(user_id=user_id).values_list(
+                Value(kind, output_field=CharField()), 'recipe_id'
+            ).order_by()
+            for kind in missing
+        ]
+        rows = queries[0].union(*queries[1:], all=True)
+        for kind, recipe_id in rows:
+            loaded[kind].append(recipe_id)
+        loaded = {
+            keys[kind]: array('q', sorted(ids))
+            for kind, ids in loaded.items()
+        }
+        cache.set_many(loaded, marks_options()['TIMEOUT'])
+        cached.update(loaded)
+    return {kind: cached[keys[kind]] for kind in MODELS}
+
+
+def recipe_ids(request, kind):
+    """Множество id рецептов текущего пользователя (одно на запрос)"""
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_recipe_marks'):
+        request._recipe_marks = {
+            name: frozenset(ids)
+            for name, ids in _load(request.user.pk).items()
+        }
+    return request._recipe_marks[kind]
+
+
+def contains(request, kind, recipe_id):
+    return recipe_id in recipe_ids(request, kind)
+
+
+def filter_marked(queryset, request, kind, value):
+    """Рецепты из множества (value=True) или не из него"""
+    ids = recipe_ids(request, kind)
+    if len(ids) > marks_options()['FILTER_LIMIT']:
+        ids = MODELS[kind].objects.filter(
+            user=request.user).values('recipe')
+    if value:
+        return queryset.filter(id__in=ids)
+    return queryset.exclude(id__in=ids)
+
+
+def changed(kind, user_id):
+    """Рецепт добавлен или удалён: множество сбрасывается после коммита"""
+    transaction.on_commit(lambda: cache.delete(_cache_key(kind, user_id)))
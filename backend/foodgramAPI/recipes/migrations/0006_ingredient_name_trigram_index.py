@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 11:40
+
+from django.db import migrations
+
+# Выражение индекса совпадает с тем, что Django строит для icontains
+# и istartswith: UPPER("name"::text) LIKE UPPER(%s)
+CREATE_INDEX = '''
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm
+    ON recipes_ingredient USING gin ((UPPER(name::text)) gin_trgm_ops);
+'''
+DROP_INDEX = 'DROP INDEX IF EXISTS recipes_ingredient_name_trgm;'
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
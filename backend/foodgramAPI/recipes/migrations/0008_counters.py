@@ -0,0 +1,57 @@
+# Generated by Django 4.2 on 2026-10-18 01:32
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(related, foreign_key):
+    return Coalesce(Subquery(
+        related.objects.filter(**{foreign_key: OuterRef('pk')})
+        .order_by()
+        .values(foreign_key)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'CustomUser')
+    Recipe.objects.update(
+        favorites_count=count_rows(
+            apps.get_model('recipes', 'FavoriteRecipe'), 'recipe'),
+        in_carts_count=count_rows(
+            apps.get_model('recipes', 'ShoppingCartRecipe'), 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=count_rows(Recipe, 'author'),
+        subscribers_count=count_rows(
+            apps.get_model('users', 'Subscription'), 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_created_at_id_idx'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
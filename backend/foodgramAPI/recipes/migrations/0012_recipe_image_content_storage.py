@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 01:49
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(max_length=256, storage=recipes.storage.get_content_storage, upload_to='recipes/images/', verbose_name='Фото рецепта'),
+        ),
+    ]
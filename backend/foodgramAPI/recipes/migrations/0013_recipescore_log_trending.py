@@ -0,0 +1,25 @@
+# Generated by Django 4.2 on 2026-10-18 03:10
+
+import math
+
+from django.db import migrations
+
+
+def trending_to_log2(apps, schema_editor):
+    """trending хранится как log2 суммы (см. recipes/scores.py)"""
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    scores = list(RecipeScore.objects.filter(trending__gt=0))
+    for score in scores:
+        score.trending = math.log2(score.trending)
+    RecipeScore.objects.bulk_update(scores, ['trending'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_image_content_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(trending_to_log2, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 02:39
+
+from django.db import migrations, models
+
+
+def drop_scores(apps, schema_editor):
+    """
+    popular теперь log2 суммы событий с затуханием (см. recipes/scores.py)
+    и из счётчиков не выводится. Рейтинги — производные данные: без строк
+    следующий запуск compute_recipe_scores посчитает их по всем событиям
+    """
+    apps.get_model('recipes', 'RecipeScore').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipescore_log_trending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipescore',
+            name='popular',
+            field=models.FloatField(default=0, verbose_name='Популярность с медленным затуханием'),
+        ),
+        migrations.RunPython(drop_scores, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.contrib.auth import get_user_model
 
+from .storage import get_content_storage
+
 User = get_user_model()
 
 
@@ -45,9 +47,16 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=get_content_storage,
         verbose_name='Фото рецепта',
         max_length=256,
     )
+    # Пути уменьшенных версий фото (см. renditions.py)
+    image_renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Версии фото',
+    )
     text = models.TextField(
         verbose_name='Описание',
     )
@@ -65,11 +74,37 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    # Счётчики поддерживаются сигналами (см. counters.py)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок',
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-created_at']
+        indexes = [
+            # Ключ выдачи ленты по курсору (RecipePaginator)
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipe_created_at_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -122,6 +157,10 @@ class BaseRecipeRelation(models.Model):
         verbose_name='Рецепт',
         related_name='+',
     )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         abstract = True
@@ -171,3 +210,123 @@ class ShoppingCartRecipe(BaseRecipeRelation):
                 name='unique_user_recipe_in_shopping_cart'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итог по ингредиенту в списке покупок пользователя.
+    Денормализованная таблица: поддерживается инкрементально
+    при изменении корзины и состава рецептов (см. shopping_list.py)
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} → {self.ingredient}: {self.amount}'
+
+
+class RecipeScore(models.Model):
+    """
+    Предрасчитанный рейтинг рецепта для ?ordering=popular|trending.
+    Заполняется командой compute_recipe_scores (см. scores.py)
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+    popular = models.FloatField(
+        default=0,
+        verbose_name='Популярность с медленным затуханием',
+    )
+    trending = models.FloatField(
+        default=0,
+        verbose_name='Популярность с затуханием',
+    )
+    counted_until = models.DateTimeField(
+        verbose_name='Учтены события до',
+    )
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=['-popular', '-recipe'],
+                name='recipe_score_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_score_trending_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.popular:.3g} / {self.trending:.3g}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя (/api/recipes/feed/).
+    Строки раскладываются при публикации рецепта (см. timeline.py)
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    published_at = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            # Страница ленты — один диапазон по этому индексу
+            models.Index(
+                fields=['user', '-published_at', '-recipe'],
+                name='timeline_user_published_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} ← {self.recipe_id}'
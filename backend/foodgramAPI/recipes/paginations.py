@@ -1,6 +1,106 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.pagination import CountingPaginator
 
 
 class RecipePaginator(PageNumberPagination):
+    """
+    Постраничная выдача рецептов. По умолчанию — номера страниц;
+    с параметром ?cursor= (пустым для первой страницы) — выдача
+    по ключу (created_at, id) без OFFSET и без COUNT(*)
+    """
+    django_paginator_class = CountingPaginator
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    keyset_ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Неверный курсор'
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+
+        queryset = queryset.order_by(*self.keyset_ordering)
+        if position is not None:
+            created_at, pk = position
+            # Первое условие — диапазон по индексу, второе отсекает
+            # уже выданные рецепты с той же датой создания
+            queryset = queryset.filter(
+                Q(created_at__lte=created_at)
+                & (Q(created_at__lt=created_at) | Q(id__lt=pk))
+            )
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if rows:
+            self.last_key = (rows[-1].created_at, rows[-1].pk)
+        return rows
+
+    def paginate_keys(self, request, fetch_keys):
+        """
+        Выдача по курсору для готовых ключей: fetch_keys(position, limit)
+        возвращает до limit ключей (дата, id) по убыванию
+        """
+        self.keyset = True
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''))
+        keys = fetch_keys(position, page_size + 1)
+        self.has_next = len(keys) > page_size
+        keys = keys[:page_size]
+        if keys:
+            self.last_key = keys[-1]
+        return keys
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(*self.last_key),
+        )
+
+    @staticmethod
+    def encode_cursor(created_at, pk):
+        value = f'{created_at.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(value).decode()
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            value = base64.urlsafe_b64decode(cursor.encode()).decode()
+            created_at, pk = value.split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
@@ -0,0 +1,240 @@
+"""
+Уменьшенные версии фото рецептов и аватаров.
+
+Оригинал сохраняется в запросе как есть, а версии (thumbnail, card,
+full) в форматах WebP и JPEG строятся Pillow после коммита в пуле
+воркеров, не задерживая ответ. Исполнитель задаётся настройкой
+IMAGE_RENDITIONS['EXECUTOR']:
+- 'thread' — пул потоков процесса (Pillow отпускает GIL при сжатии);
+- 'process' — пул процессов для многоядерных машин;
+- 'sync' — сразу в вызывающем потоке (тесты, команды управления).
+
+render() работает только с хранилищем файлов и не обращается к базе,
+поэтому годится для пула процессов. Пути готовых версий записываются
+в поле модели вместе с именем оригинала (ключ 'source'); пока они
+не совпадают с текущим файлом, сериализаторы версии не выводят.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from api.authentication import invalidate_user
+
+from . import response_cache
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+DEFAULTS = {
+    'EXECUTOR': 'thread',
+    'WORKERS': 2,
+    # Вписать в рамку (ширина, высота) с сохранением пропорций
+    'SIZES': {
+        'thumbnail': (160, 160),
+        'card': (480, 480),
+        'full': (1280, 1280),
+    },
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'PREFIX': 'renditions',
+}
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def rendition_options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_RENDITIONS', {})}
+
+
+def _executor(kind, workers):
+    """Пул создаётся лениво, один на процесс и настройку"""
+    with _executors_lock:
+        if (kind, workers) not in _executors:
+            pool_class = (
+                ProcessPoolExecutor if kind == 'process'
+                else ThreadPoolExecutor)
+            _executors[kind, workers] = pool_class(max_workers=workers)
+        return _executors[kind, workers]
+
+
+def rendition_name(source, size, extension, prefix):
+    base, _ = os.path.splitext(source)
+    return f'{prefix}/{base}/{size}.{extension}'
+
+
+def _encode(image, extension, quality):
+    if extension == 'jpeg' and image.mode != 'RGB':
+        # JPEG без прозрачности: фон белый
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, PIL_FORMATS[extension], quality=quality)
+    return buffer.getvalue()
+
+
+def render(source, options, overwrite=False):
+    """
+    Построить версии оригинала и записать их в хранилище.
+    Имя оригинала — хеш содержимого (storage.py), поэтому уже
+    построенные версии переиспользуются, если не задан overwrite.
+    Возвращает {размер: {формат: путь}}
+    """
+    names = {
+        size: {
+            extension: rendition_name(
+                source, size, extension, options['PREFIX'])
+            for extension in options['FORMATS']
+        }
+        for size in options['SIZES']
+    }
+    if not overwrite and all(
+            default_storage.exists(name)
+            for formats in names.values() for name in formats.values()):
+        # Время изменения — для сборщика мусора (storage.py)
+        for formats in names.values():
+            for name in formats.values():
+                os.utime(default_storage.path(name))
+        return names
+
+    with default_storage.open(source, 'rb') as original:
+        image = Image.open(original)
+        # Анимация — только первый кадр; поворот по EXIF
+        image.seek(0)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              or image.mode in ('LA', 'PA') else 'RGB')
+
+    renditions = {}
+    for size, box in options['SIZES'].items():
+        scaled = image.copy()
+        scaled.thumbnail(tuple(box), Image.LANCZOS)
+        renditions[size] = {}
+        for extension, name in names[size].items():
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            renditions[size][extension] = default_storage.save(
+                name, ContentFile(_encode(scaled, extension,
+                                          options['QUALITY'])))
+    return renditions
+
+
+def _store(model, pk, field, source, future, pooled):
+    """Записать пути версий, если у объекта всё ещё тот же оригинал"""
+    try:
+        renditions = future.result()
+    except Exception:
+        logger.exception('Не удалось построить версии %s', source)
+        return
+    try:
+        updated = model.objects.filter(
+            pk=pk, **{field: source}
+        ).update(**{
+            f'{field}_renditions': {'source': source, **renditions},
+            'updated_at': timezone.now(),
+        })
+        if updated:
+            # update() не отправляет сигналы: кэши сбрасываются явно
+            recipes = (
+                [pk] if model is Recipe else
+                Recipe.objects.filter(author_id=pk).values_list(
+                    'id', flat=True))
+            response_cache.evict_recipes(recipes)
+            if model is not Recipe:
+                invalidate_user(pk)
+    finally:
+        if pooled:
+            # Соединение потока пула не должно висеть открытым
+            close_old_connections()
+
+
+def schedule(instance, field):
+    """
+    Поставить построение версий в очередь после коммита, если
+    оригинал изменился. Вызывается из post_save
+    """
+    source = getattr(instance, field).name
+    renditions = getattr(instance, f'{field}_renditions')
+    if not source or renditions.get('source') == source:
+        return
+    model, pk = type(instance), instance.pk
+    options = rendition_options()
+
+    def submit():
+        pooled = options['EXECUTOR'] != 'sync'
+        if pooled:
+            future = _executor(
+                options['EXECUTOR'], options['WORKERS']
+            ).submit(render, source, options)
+        else:
+            future = _completed(render, source, options)
+        future.add_done_callback(
+            lambda done: _store(model, pk, field, source, done, pooled))
+
+    transaction.on_commit(submit)
+
+
+def _completed(function, *args):
+    future = Future()
+    try:
+        future.set_result(function(*args))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def backfill(force=False):
+    """
+    Построить версии синхронно для всех объектов, где их нет или они
+    устарели (force — для всех). Возвращает число обработанных файлов
+    """
+    options = rendition_options()
+    built = 0
+    for model, field in ((Recipe, 'image'), (User, 'avatar')):
+        objects = model.objects.exclude(**{field: ''}).exclude(
+            **{f'{field}__isnull': True}
+        ).values_list('pk', field, f'{field}_renditions')
+        for pk, source, renditions in objects.iterator():
+            if not force and renditions.get('source') == source:
+                continue
+            _store(model, pk, field, source,
+                   _completed(render, source, options, force),
+                   pooled=False)
+            built += 1
+    return built
+
+
+def rendition_urls(file, renditions, request=None):
+    """URL готовых версий файла или None, пока они не построены"""
+    if not file or renditions.get('source') != file.name:
+        return None
+
+    def absolute(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    return {
+        size: {
+            extension: absolute(name)
+            for extension, name in formats.items()
+        }
+        for size, formats in renditions.items() if size != 'source'
+    }
@@ -0,0 +1,175 @@
+"""
+Кэш ответов списка и карточки рецептов для анонимных пользователей.
+
+Бэкенд — псевдоним из settings.CACHES (RECIPE_RESPONSE_CACHE['ALIAS']):
+файловый кэш, Redis или локальная память для одного процесса.
+
+Ключ ответа — путь, хост и нормализованная строка запроса плюс версии
+областей выдачи (все рецепты, рецепты автора, ранжированная выдача).
+Каждый ответ помечается id рецептов, которые в него вошли.
+Инвалидация точечная:
+- изменение рецепта или профиля его автора удаляет ответы с пометкой
+  этих рецептов;
+- создание и удаление рецепта сдвигает страницы списков, поэтому
+  меняют версии области «все рецепты» и области автора;
+- пересчёт рейтингов меняет версию ранжированной выдачи.
+Помеченные ключи хранятся списком в кэше и дописываются без блокировок:
+при гонке ключ может выпасть из пометки и дожить до TIMEOUT.
+"""
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 60,
+}
+
+PREFIX = 'recipes:responses'
+
+# Заголовки, которые сохраняются вместе с ответом
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+
+
+def cache_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_RESPONSE_CACHE', {})}
+
+
+def _cache():
+    return caches[cache_options()['ALIAS']]
+
+
+def _tag_key(recipe_id):
+    return f'{PREFIX}:tag:{recipe_id}'
+
+
+def _version_key(scope):
+    return f'{PREFIX}:version:{scope}'
+
+
+def list_scopes(params):
+    """Области выдачи, от которых зависит страница списка"""
+    author = params.getlist('author')
+    scopes = [f'author:{author[0]}' if len(author) == 1 else 'all']
+    if params.get('ordering'):
+        scopes.append('ranked')
+    return scopes
+
+
+def scope_versions(scopes, cache=None):
+    cache = cache or _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def response_key(request, scopes=()):
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    versions = scope_versions(scopes) if scopes else []
+    signature = '|'.join([
+        request.scheme, request.get_host(), request.path, query, *versions])
+    return f'{PREFIX}:{hashlib.md5(signature.encode()).hexdigest()}'
+
+
+def _recipe_ids(data):
+    if isinstance(data, dict) and 'results' in data:
+        return [item['id'] for item in data['results']]
+    if isinstance(data, dict) and 'id' in data:
+        return [data['id']]
+    return []
+
+
+def cached_response(request, render, scopes=()):
+    """
+    Ответ из кэша или render() с сохранением успешного ответа.
+    Авторизованным пользователям всегда отвечает render()
+    """
+    options = cache_options()
+    if request.user.is_authenticated or not options['TIMEOUT']:
+        return render()
+
+    cache = _cache()
+    key = response_key(request, scopes)
+    cached = cache.get(key)
+    if cached is not None:
+        data, headers = cached
+        response = Response(data, headers=headers)
+        # Валидаторы сохранены вместе с ответом и актуальны, пока он
+        # в кэше: 304 отдаётся без запросов к базе
+        return get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(
+                headers.get('Last-Modified', '')),
+            response=response,
+        ) or response
+
+    response = render()
+    if response.status_code != 200:
+        return response
+    headers = {
+        name: response[name] for name in CACHED_HEADERS if name in response
+    }
+    cache.set(key, (response.data, headers), options['TIMEOUT'])
+    recipe_ids = _recipe_ids(response.data)
+    tags = cache.get_many([_tag_key(pk) for pk in recipe_ids])
+    cache.set_many({
+        _tag_key(pk): tags.get(_tag_key(pk), []) + [key]
+        for pk in recipe_ids
+    }, options['TIMEOUT'])
+    return response
+
+
+def _after_commit(function):
+    """Сбросить сразу и повторно после коммита (как каталог ингредиентов)"""
+    function()
+    transaction.on_commit(function)
+
+
+def evict_recipes(recipe_ids):
+    """Удалить ответы, в которые вошли рецепты"""
+    recipe_ids = list(recipe_ids)
+
+    def evict():
+        cache = _cache()
+        tag_keys = [_tag_key(pk) for pk in recipe_ids]
+        tagged = cache.get_many(tag_keys)
+        cache.delete_many(
+            [key for keys in tagged.values() for key in keys] + tag_keys)
+
+    if recipe_ids:
+        _after_commit(evict)
+
+
+def bump_scopes(*scopes):
+    """Сменить версии областей: все их страницы списков устаревают"""
+    def bump():
+        _cache().set_many({
+            _version_key(scope): uuid.uuid4().hex for scope in scopes
+        }, None)
+
+    _after_commit(bump)
+
+
+def recipe_published(recipe):
+    bump_scopes('all', f'author:{recipe.author_id}', 'ranked')
+
+
+def recipe_removed(recipe):
+    evict_recipes([recipe.id])
+    bump_scopes('all', f'author:{recipe.author_id}', 'ranked')
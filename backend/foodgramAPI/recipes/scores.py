@@ -0,0 +1,137 @@
+"""
+Рейтинги рецептов для ?ordering=popular|trending.
+
+Оба рейтинга — взвешенные суммы событий (строк FavoriteRecipe
+и ShoppingCartRecipe) с экспоненциальным затуханием по времени:
+popular — с долгим периодом полураспада (POPULAR_HALF_LIFE_HOURS),
+trending — с коротким (HALF_LIFE_HOURS).
+
+Затухание «вперёд»: вклад события равен
+weight * 2 ** ((created_at - EPOCH) / half_life). Все рейтинги
+в момент t отличаются от этих сумм одним множителем 2 ** (-(t - EPOCH) /
+half_life), поэтому порядок по сумме совпадает с порядком по затухшему
+рейтингу: рейтинги рецептов без новых событий затухают сами, без
+перезаписи, а новые события можно просто прибавлять. Сама сумма растёт
+экспоненциально и через несколько лет (при коротком half_life — сразу)
+не помещается во float, поэтому хранится её log2: вклад события —
+log2(weight) + (created_at - EPOCH) / half_life, сложение — log2_add().
+Смена периодов полураспада требует полного пересчёта (--full).
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import response_cache
+from .models import FavoriteRecipe, Recipe, RecipeScore, ShoppingCartRecipe
+
+DEFAULTS = {
+    'FAVORITE_WEIGHT': 2,
+    'CART_WEIGHT': 1,
+    'HALF_LIFE_HOURS': 72,
+    'POPULAR_HALF_LIFE_HOURS': 30 * 24,
+}
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Строки, созданные в последние секунды, могут быть ещё не закоммичены:
+# они попадут в следующий запуск
+SETTLE = timedelta(seconds=5)
+
+
+def score_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_SCORES', {})}
+
+
+def decayed(weight, created_at, half_life):
+    """log2 вклада события"""
+    return math.log2(weight) + (created_at - EPOCH) / half_life
+
+
+def log2_add(a, b):
+    """log2(2 ** a + 2 ** b) без переполнения; None — пустая сумма"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def refresh(full=False, now=None):
+    """
+    Пересчитать рейтинги. Инкрементально учитываются события, созданные
+    после прошлого запуска. Удаления из избранного и корзины попадают
+    в рейтинги только при полном пересчёте. Возвращает число рецептов
+    """
+    options = score_options()
+    half_lives = {
+        'popular': timedelta(hours=options['POPULAR_HALF_LIFE_HOURS']),
+        'trending': timedelta(hours=options['HALF_LIFE_HOURS']),
+    }
+    until = (now or timezone.now()) - SETTLE
+    since = None if full else RecipeScore.objects.aggregate(
+        since=Max('counted_until'))['since']
+
+    sums = {}
+    for model, weight in (
+        (FavoriteRecipe, options['FAVORITE_WEIGHT']),
+        (ShoppingCartRecipe, options['CART_WEIGHT']),
+    ):
+        if weight <= 0:
+            continue
+        events = model.objects.filter(created_at__lte=until)
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        for recipe_id, created_at in events.values_list(
+                'recipe_id', 'created_at').order_by().iterator():
+            row = sums.setdefault(recipe_id, {})
+            for field, half_life in half_lives.items():
+                row[field] = log2_add(
+                    row.get(field), decayed(weight, created_at, half_life))
+
+    with transaction.atomic():
+        if full:
+            RecipeScore.objects.all().delete()
+            stored = {}
+        else:
+            stored = {
+                recipe_id: {'popular': popular, 'trending': trending}
+                for recipe_id, popular, trending
+                in RecipeScore.objects.select_for_update().filter(
+                    recipe_id__in=sums).values_list(
+                        'recipe_id', 'popular', 'trending')
+            }
+        # Рецепт мог быть удалён после чтения событий
+        existing = Recipe.objects.filter(id__in=sums).values_list(
+            'id', flat=True)
+        RecipeScore.objects.bulk_create(
+            [
+                RecipeScore(
+                    recipe_id=recipe_id,
+                    counted_until=until,
+                    **{
+                        field: log2_add(
+                            stored.get(recipe_id, {}).get(field), value)
+                        for field, value in sums[recipe_id].items()
+                    },
+                )
+                for recipe_id in existing.iterator()
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['recipe'],
+            update_fields=['popular', 'trending', 'counted_until'],
+        )
+    if sums or full:
+        response_cache.bump_scopes('ranked')
+    return len(sums)
+
+
+def order_by_score(queryset, field):
+    """Рецепты без рейтинга идут последними, по дате создания"""
+    return queryset.order_by(
+        F(f'score__{field}').desc(nulls_last=True), '-created_at', '-id')
@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from django.core.exceptions import ValidationError as DjangoValidationError
 from recipes.models import Ingredient, Recipe, RecipeIngredient, FavoriteRecipe, ShoppingCartRecipe
 from users.serializers import UserSerializer
+from . import fragments, marks, shopping_list
+from .renditions import rendition_urls
 from .fields import ImageDataField
 
 
@@ -26,6 +29,12 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'unit', 'amount')
 
 
+class RecipeIngredientWriteSerializer(serializers.Serializer):
+    """Сериализатор ингредиента при создании/обновлении рецепта"""
+    id = serializers.IntegerField(source='ingredient.id')
+    amount = serializers.IntegerField(min_value=1)
+
+
 class BaseRecipeActionSerializer(serializers.ModelSerializer):
     """Базовый сериализатор для действий с рецептами"""
 
@@ -37,6 +46,8 @@ class BaseRecipeActionSerializer(serializers.ModelSerializer):
             'id': recipe.id,
             'name': recipe.name,
             'image': self._get_image_url(recipe, request),
+            'image_renditions': rendition_urls(
+                recipe.image, recipe.image_renditions, request),
             'cooking_time': recipe.cooking_time
         }
 
@@ -65,7 +76,7 @@ class ShoppingCartRecipeSerializer(BaseRecipeActionSerializer):
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор для создания/обновления рецептов"""
     image = ImageDataField()
-    ingredients = RecipeIngredientSerializer(
+    ingredients = RecipeIngredientWriteSerializer(
         source='recipe_ingredients',
         many=True,
         required=True
@@ -79,7 +90,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             'image',
             'text',
             'cooking_time',
-            'recipe_ingredients')
+            'ingredients')
         extra_kwargs = {
             'cooking_time': {'min_value': 5}
         }
@@ -98,15 +109,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'ingredients': 'Ингредиенты не должны повторяться'
             })
 
+        existing = Ingredient.objects.filter(
+            id__in=ingredient_ids).count()
+        if existing != len(ingredient_ids):
+            raise serializers.ValidationError({
+                'ingredients': 'Указан несуществующий ингредиент'
+            })
+
         return data
 
     @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
-        recipe = Recipe.objects.create(
-            author=self.context['request'].user,
-            **validated_data
-        )
+        recipe = Recipe.objects.create(**validated_data)
         self._create_ingredients(recipe, ingredients_data)
         return recipe
 
@@ -116,8 +131,10 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         recipe = super().update(instance, validated_data)
 
         if ingredients_data is not None:
+            shopping_list.remove_recipe_everywhere(recipe.id)
             instance.recipe_ingredients.all().delete()
             self._create_ingredients(recipe, ingredients_data)
+            shopping_list.add_recipe_everywhere(recipe.id)
 
         return recipe
 
@@ -130,11 +147,31 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             ) for item in ingredients_data
         ])
 
+    def to_representation(self, instance):
+        return RecipeReadSerializer(instance, context=self.context).data
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Фрагменты всей страницы читаются и пишутся одним обращением к кэшу"""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if hasattr(data, 'all') else data)
+        self.child.load_fragments(recipes)
+        try:
+            return [self.child.to_representation(item) for item in recipes]
+        finally:
+            self.child.save_fragments()
+
 
 class RecipeReadSerializer(serializers.ModelSerializer):
-    """Сериализатор для чтения рецептов"""
+    """
+    Сериализатор для чтения рецептов. Общая для всех часть вывода
+    берётся из кэша фрагментов (fragments.py), флаги пользователя
+    вычисляются заново
+    """
     author = UserSerializer(read_only=True)
     image = ImageDataField()
+    image_renditions = serializers.SerializerMethodField()
     is_favorite = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     ingredients = RecipeIngredientSerializer(
@@ -149,19 +186,77 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'author',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time',
             'is_favorite',
             'is_in_shopping_cart',
             'ingredients'
         ]
+        list_serializer_class = RecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fragment_keys = {}
+        self._fragments = {}
+        self._missed = {}
+
+    def load_fragments(self, recipes):
+        version = fragments.context_version(self.context.get('request'))
+        self._fragment_keys = {
+            recipe.pk: fragments.fragment_key(recipe, version)
+            for recipe in recipes
+        }
+        self._fragments = fragments.fragment_cache().get_many(
+            list(self._fragment_keys.values()))
+        self._missed = {}
+        # Ингредиенты нужны только рецептам без фрагмента
+        prefetch_related_objects(
+            [recipe for recipe in recipes
+             if self._fragment_keys[recipe.pk] not in self._fragments],
+            'recipe_ingredients__ingredient')
+
+    def save_fragments(self):
+        if self._missed:
+            fragments.fragment_cache().set_many(
+                self._missed, fragments.fragment_options()['TIMEOUT'])
+        self._missed = {}
+
+    def to_representation(self, instance):
+        if instance.pk not in self._fragment_keys:
+            self.load_fragments([instance])
+            try:
+                return self.to_representation(instance)
+            finally:
+                self.save_fragments()
+
+        key = self._fragment_keys[instance.pk]
+        fragment = self._fragments.get(key)
+        if fragment is None:
+            data = super().to_representation(instance)
+            self._missed[key] = data
+            return data
+        return self._with_user_flags(fragment, instance)
+
+    def _with_user_flags(self, fragment, instance):
+        data = dict(fragment)
+        data['author'] = {
+            **fragment['author'],
+            'is_subscribed': self.fields['author'].get_is_subscribed(
+                instance.author),
+        }
+        data['is_favorite'] = self.get_is_favorite(instance)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(instance)
+        return data
+
+    def get_image_renditions(self, obj):
+        return rendition_urls(
+            obj.image, obj.image_renditions, self.context.get('request'))
 
     def get_is_favorite(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and obj.favorites.filter(
-            user=user).exists()
+        return marks.contains(
+            self.context.get('request'), marks.FAVORITES, obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        return user.is_authenticated and obj.shopping_cart.filter(
-            user=user).exists()
+        return marks.contains(
+            self.context.get('request'), marks.CART, obj.pk)
@@ -0,0 +1,126 @@
+"""
+Поддержка денормализованных итогов списка покупок (ShoppingListItem).
+
+Итоги меняются инкрементально: добавление рецепта в корзину прибавляет
+его ингредиенты, удаление вычитает, замена состава рецепта вычитает
+старый состав и прибавляет новый у всех, у кого рецепт в корзине.
+rebuild() и verify() сверяют таблицу с живой агрегацией корзины.
+"""
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+
+from .models import RecipeIngredient, ShoppingCartRecipe, ShoppingListItem
+
+UPSERT_SQL = '''
+    INSERT INTO {items} (user_id, ingredient_id, amount)
+    SELECT cart.user_id, ri.ingredient_id, ri.amount
+    FROM {cart} AS cart
+    JOIN {recipe_ingredients} AS ri ON ri.recipe_id = cart.recipe_id
+    WHERE {where}
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET amount = {items}.amount + EXCLUDED.amount
+'''
+
+
+def _upsert(where, params):
+    sql = UPSERT_SQL.format(
+        items=ShoppingListItem._meta.db_table,
+        cart=ShoppingCartRecipe._meta.db_table,
+        recipe_ingredients=RecipeIngredient._meta.db_table,
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _subtract(recipe_id, users):
+    """Вычесть состав рецепта из итогов указанных пользователей"""
+    recipe_amount = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id, ingredient=OuterRef('ingredient')
+    ).values('amount')
+    items = ShoppingListItem.objects.filter(
+        users,
+        ingredient__in=RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values('ingredient'),
+    )
+    items.update(amount=F('amount') - Subquery(recipe_amount))
+    items.filter(amount=0).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в корзину (строка корзины уже сохранена)"""
+    _upsert('cart.user_id = %s AND cart.recipe_id = %s',
+            [user_id, recipe_id])
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт удаляется из корзины (строка корзины ещё существует)"""
+    _subtract(recipe_id, Q(user_id=user_id))
+
+
+def remove_recipe_everywhere(recipe_id):
+    """Вычесть текущий состав рецепта у всех, у кого он в корзине"""
+    _subtract(recipe_id, Q(user__in=ShoppingCartRecipe.objects.filter(
+        recipe_id=recipe_id).values('user')))
+
+
+def add_recipe_everywhere(recipe_id):
+    """Прибавить текущий состав рецепта всем, у кого он в корзине"""
+    _upsert('cart.recipe_id = %s', [recipe_id])
+
+
+def live_totals(user_ids=None):
+    """Итоги, посчитанные напрямую из корзины и состава рецептов"""
+    queryset = ShoppingCartRecipe.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values_list(
+            'user', 'recipe__recipe_ingredients__ingredient'
+        ).annotate(
+            total=Sum('recipe__recipe_ingredients__amount')
+        ).order_by()
+        if ingredient_id is not None
+    }
+
+
+def stored_totals(user_ids=None):
+    queryset = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        queryset = queryset.filter(user__in=user_ids)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset.values_list(
+            'user', 'ingredient', 'amount')
+    }
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Пересобрать итоги из живой агрегации; возвращает число строк"""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    items.delete()
+    totals = live_totals(user_ids)
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+        for (user_id, ingredient_id), amount in totals.items()
+    ], batch_size=1000)
+    return len(totals)
+
+
+def verify(user_ids=None):
+    """
+    Расхождения таблицы с живой агрегацией:
+    {(user_id, ingredient_id): (в таблице, в корзине)}
+    """
+    live = live_totals(user_ids)
+    stored = stored_totals(user_ids)
+    return {
+        key: (stored.get(key), live.get(key))
+        for key in live.keys() | stored.keys()
+        if stored.get(key) != live.get(key)
+    }
@@ -0,0 +1,138 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from django.contrib.auth import get_user_model
+
+from api.conditional import bump_user_state
+
+from . import marks, renditions, response_cache, shopping_list, timeline
+from .catalogue import bump_version
+from .counters import increment
+from .models import (
+    FavoriteRecipe,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartRecipe,
+)
+
+User = get_user_model()
+
+MARK_KINDS = {
+    FavoriteRecipe: marks.FAVORITES,
+    ShoppingCartRecipe: marks.CART,
+}
+
+
+@receiver(post_save, sender=ShoppingCartRecipe)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    """Прибавить ингредиенты рецепта к итогам списка покупок"""
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCartRecipe)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """
+    Вычесть ингредиенты рецепта из итогов. pre_delete срабатывает и при
+    каскадном удалении рецепта, пока его состав ещё не удалён
+    """
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredient_catalogue(sender, **kwargs):
+    """Любая запись в Ingredient сбрасывает каталоги воркеров"""
+    bump_version()
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def count_favorite(sender, instance, created, **kwargs):
+    if created:
+        increment(Recipe, instance.recipe_id, 'favorites_count')
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def uncount_favorite(sender, instance, **kwargs):
+    increment(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCartRecipe)
+def count_cart_entry(sender, instance, created, **kwargs):
+    if created:
+        increment(Recipe, instance.recipe_id, 'in_carts_count')
+
+
+@receiver(post_delete, sender=ShoppingCartRecipe)
+def uncount_cart_entry(sender, instance, **kwargs):
+    increment(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe(sender, instance, created, **kwargs):
+    if created:
+        increment(User, instance.author_id, 'recipes_count')
+
+
+@receiver(post_save, sender=Recipe)
+def publish_to_timelines(sender, instance, created, **kwargs):
+    """Новый рецепт попадает в ленты подписчиков автора"""
+    if created:
+        timeline.publish(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(sender, instance, **kwargs):
+    increment(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def evict_recipe_responses(sender, instance, created, **kwargs):
+    """Кэш анонимных ответов: новый рецепт сдвигает списки"""
+    if created:
+        response_cache.recipe_published(instance)
+    else:
+        response_cache.evict_recipes([instance.id])
+
+
+@receiver(post_delete, sender=Recipe)
+def evict_removed_recipe_responses(sender, instance, **kwargs):
+    response_cache.recipe_removed(instance)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def evict_ingredient_responses(sender, instance, **kwargs):
+    """Переименование ингредиента меняет рецепты, где он есть"""
+    response_cache.evict_recipes(RecipeIngredient.objects.filter(
+        ingredient=instance).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+@receiver(post_delete, sender=ShoppingCartRecipe)
+def bump_owner_state(sender, instance, **kwargs):
+    """Флаги в ответах пользователя изменились: сменить его ETag"""
+    bump_user_state(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def build_image_renditions(sender, instance, **kwargs):
+    """Новое фото: уменьшенные версии строятся после коммита"""
+    renditions.schedule(instance, 'image')
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCartRecipe)
+def remember_mark(sender, instance, created, **kwargs):
+    """Множества избранного и корзины в кэше сбрасываются при записи"""
+    if created:
+        marks.changed(MARK_KINDS[sender], instance.user_id)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCartRecipe)
+def forget_mark(sender, instance, **kwargs):
+    marks.changed(MARK_KINDS[sender], instance.user_id)
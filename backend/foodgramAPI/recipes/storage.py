@@ -0,0 +1,101 @@
+"""
+Хранилище загруженных изображений с именами по содержимому.
+
+Файл сохраняется как <каталог>/<xx>/<sha256><расширение>: повторная
+загрузка тех же байтов (например, то же фото при каждом PATCH рецепта)
+не пишет ничего на диск. Один файл могут разделять несколько объектов,
+поэтому хранилище не удаляет файлы по одиночке; неиспользуемые файлы
+и уменьшенные версии удаляет collect_garbage()
+(команда collect_media_garbage).
+"""
+import hashlib
+import os
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import FileSystemStorage, default_storage
+
+# Каталоги внутри MEDIA_ROOT, которыми управляет сборщик мусора
+MANAGED_DIRS = ('recipes/images', 'users/avatars')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Имя из upload_to заменяется хешем содержимого"""
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            self.touch(name)
+            return name
+        return super()._save(name, content)
+
+    def touch(self, name):
+        """
+        Обновить время изменения переиспользованного файла: сборщик
+        мусора не удалит его, пока ссылка на него не закоммичена
+        """
+        os.utime(self.path(name))
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    """Для ImageField(storage=...): в миграциях остаётся ссылка"""
+    return content_storage
+
+
+def referenced_files():
+    """Имена оригиналов и версий, на которые ссылается база"""
+    # models импортирует это хранилище
+    from .models import Recipe
+    from .renditions import rendition_options
+
+    names = set()
+    for model, field in ((Recipe, 'image'), (get_user_model(), 'avatar')):
+        rows = model.objects.exclude(**{field: ''}).exclude(
+            **{f'{field}__isnull': True}
+        ).values_list(field, f'{field}_renditions')
+        for name, renditions in rows.iterator():
+            names.add(name)
+            for size, formats in renditions.items():
+                if size != 'source':
+                    names.update(formats.values())
+    return names, rendition_options()['PREFIX']
+
+
+def _walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for child in directories:
+        yield from _walk(storage, f'{directory}/{child}')
+
+
+def collect_garbage(min_age=3600, dry_run=False):
+    """
+    Удалить файлы в MANAGED_DIRS и каталоге версий, на которые нет
+    ссылок. Файлы моложе min_age секунд не трогаются: их объект может
+    быть ещё не закоммичен. Возвращает список удалённых имён
+    """
+    referenced, renditions_dir = referenced_files()
+    deadline = time.time() - min_age
+    removed = []
+    for directory in (*MANAGED_DIRS, renditions_dir):
+        for name in list(_walk(default_storage, directory)):
+            if name in referenced:
+                continue
+            if os.path.getmtime(default_storage.path(name)) > deadline:
+                continue
+            if not dry_run:
+                default_storage.delete(name)
+            removed.append(name)
+    return removed
@@ -1,13 +1,37 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
-from recipes.models import Recipe, Ingredient, FavoriteRecipe, ShoppingCartRecipe, RecipeIngredient
+from recipes import (
+    counters, fragments, marks, renditions, scores, shopping_list, storage,
+)
+from recipes.serializers import RecipeIngredientSerializer
+from recipes.models import (
+    Recipe, Ingredient, FavoriteRecipe, ShoppingCartRecipe, RecipeIngredient,
+    ShoppingListItem,
+)
+from api.testing import QueryBudgetMixin, seed_dataset, seed_user_activity
+from users.models import Subscription
 from PIL import Image
+import os
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
 import base64
 import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.http import http_date
 from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 User = get_user_model()
 
@@ -21,8 +45,11 @@ def get_base64_image():
     return f"data:image/jpeg;base64,{encoded_string}"
 
 
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class RecipeAPITestCase(APITestCase):
     def setUp(self):
+        for backend in caches.all():
+            backend.clear()
         self.user = User.objects.create_user(
             email="test@example.com",
             username="testuser",
@@ -75,6 +102,146 @@ class RecipeAPITestCase(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_download_shopping_list_sums_ingredients(self):
+        second = Recipe.objects.create(
+            author=self.user,
+            name="Второй рецепт",
+            text="Описание рецепта",
+            cooking_time=15,
+            image=self.recipe.image.name,
+        )
+        RecipeIngredient.objects.create(
+            recipe=second, ingredient=self.ingredient, amount=50)
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=second)
+
+        response = self.client.get("/api/recipes/shopping-cart/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("Соль (г) — 150", content)
+
+        response = self.client.get("/api/recipes/shopping-cart/?format=csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        content = b"".join(response.streaming_content).decode()
+        self.assertIn("Соль,г,150", content)
+
+        response = self.client.get("/api/recipes/shopping-cart/?format=pdf")
+        content = b"".join(response.streaming_content)
+        self.assertTrue(content.startswith(b"%PDF-"))
+        self.assertTrue(content.endswith(b"%%EOF\n"))
+
+    def test_shopping_list_totals_follow_changes(self):
+        pepper = Ingredient.objects.create(name="Перец", measurement_unit="г")
+        url = f"/api/recipes/{self.recipe.id}/"
+        self.client.post(url + "add-to-shopping-cart/")
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).amount, 100)
+
+        response = self.client.patch(url, {
+            "ingredients": [
+                {"id": self.ingredient.id, "amount": 30},
+                {"id": pepper.id, "amount": 5},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(shopping_list.verify(), {})
+        self.assertEqual(ShoppingListItem.objects.count(), 2)
+
+        self.client.delete(url + "remove-from-shopping-cart/")
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        self.recipe.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_rebuild_shopping_lists_command(self):
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingListItem.objects.update(amount=1)
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_shopping_lists", "--check", stderr=StringIO())
+
+        call_command("rebuild_shopping_lists", stdout=StringIO())
+        self.assertEqual(shopping_list.verify(), {})
+
+    def test_counters_follow_changes(self):
+        reader = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass")
+        self.client.post(f"/api/recipes/{self.recipe.id}/add-to-favorites/")
+        self.client.post(
+            f"/api/recipes/{self.recipe.id}/add-to-shopping-cart/")
+        FavoriteRecipe.objects.create(user=reader, recipe=self.recipe)
+        Subscription.objects.create(subscriber=reader, author=self.user)
+        self.recipe.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 2)
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(self.user.recipes_count, 1)
+        self.assertEqual(self.user.subscribers_count, 1)
+
+        self.client.delete(
+            f"/api/recipes/{self.recipe.id}/remove-from-favorites/")
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+        reader.delete()
+        self.recipe.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 0)
+        self.assertEqual(self.user.subscribers_count, 0)
+        self.assertEqual(counters.drift(), [])
+
+    def test_reconcile_counters_command(self):
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=7)
+        User.objects.update(recipes_count=0)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_counters", "--check", stderr=StringIO())
+
+        call_command(
+            "reconcile_counters", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(counters.drift(), [])
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+
+    def test_download_shopping_list_unknown_format(self):
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get("/api/recipes/shopping-cart/?format=doc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_download_shopping_list_not_modified(self):
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get("/api/recipes/shopping-cart/")
+        etag = response["ETag"]
+
+        response = self.client.get(
+            "/api/recipes/shopping-cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.delete(
+            f"/api/recipes/{self.recipe.id}/remove-from-shopping-cart/")
+        self.client.post(
+            f"/api/recipes/{self.recipe.id}/add-to-shopping-cart/")
+        response = self.client.get(
+            "/api/recipes/shopping-cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_download_shopping_list_ignores_if_modified_since(self):
+        older = Recipe.objects.create(
+            author=self.user, name="Старый рецепт", text="Описание",
+            cooking_time=5, image=self.recipe.image.name)
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=older)
+        ShoppingCartRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get("/api/recipes/shopping-cart/")
+        self.assertNotIn("Last-Modified", response)
+
+        self.client.delete(
+            f"/api/recipes/{older.id}/remove-from-shopping-cart/")
+        response = self.client.get(
+            "/api/recipes/shopping-cart/",
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_recipe_list(self):
         response = self.client.get("/api/recipes/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -90,3 +257,615 @@ class RecipeAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertGreater(len(response.data), 0)
         self.assertEqual(response.data[0]["name"], "Соль")
+
+    def test_ingredient_catalogue_follows_writes(self):
+        response = self.client.get(f"/api/ingredients/{self.ingredient.id}/")
+        self.assertEqual(response.data["name"], "Соль")
+
+        self.ingredient.name = "Соль морская"
+        self.ingredient.save()
+        response = self.client.get("/api/ingredients/?name=морская")
+        self.assertEqual(response.data[0]["id"], self.ingredient.id)
+
+        self.ingredient.delete()
+        response = self.client.get(f"/api/ingredients/{self.ingredient.id}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_load_ingredients_is_idempotent(self):
+        out = StringIO()
+        call_command("load_ingredients",
+                     str(settings.BASE_DIR / "data" / "ingredients.csv"),
+                     "--chunk-size", "500", stdout=out)
+        loaded = Ingredient.objects.count()
+        self.assertEqual(loaded, 2187)
+        self.assertIn("добавлено 2186", out.getvalue())
+
+        call_command("load_ingredients",
+                     str(settings.BASE_DIR / "data" / "ingredients.json"),
+                     stdout=StringIO())
+        self.assertEqual(Ingredient.objects.count(), loaded)
+
+    def test_load_ingredients_rejects_malformed_json(self):
+        cases = {
+            '{"name": "соль"}': "Ожидался JSON-массив",
+            '[{"name": "соль", "measurement_unit": "г"}, {"name": "перец"}]':
+                "Элемент 2: поле measurement_unit",
+            '[{"name": "соль", "measurement_unit": "г"}, "перец"]':
+                "Элемент 2: ожидался объект",
+            '[{"name": 1, "measurement_unit": "г"}]':
+                "Элемент 1: поле name",
+        }
+        for content, message in cases.items():
+            with self.subTest(content=content):
+                with tempfile.NamedTemporaryFile(
+                        "w", suffix=".json", encoding="utf-8") as source:
+                    source.write(content)
+                    source.flush()
+                    with self.assertRaisesMessage(CommandError, message):
+                        call_command(
+                            "load_ingredients", source.name,
+                            stdout=StringIO())
+
+    def test_search_ingredient_prefix_first(self):
+        Ingredient.objects.create(name="морская соль", measurement_unit="г")
+        Ingredient.objects.create(name="солод", measurement_unit="г")
+        response = self.client.get("/api/ingredients/?name=сол")
+        names = [item["name"] for item in response.data]
+        self.assertEqual(names[-1], "морская соль")
+        self.assertIn("солод", names[:-1])
+
+    def test_recipe_list_query_count_does_not_depend_on_page_size(self):
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f"Рецепт {number}",
+                text="Описание рецепта",
+                cooking_time=15,
+                image=self.recipe.image.name,
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=10)
+            FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+
+        # Прогрев кэша счётчика пагинации
+        self.client.get("/api/recipes/")
+        fragments.fragment_cache().clear()
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get("/api/recipes/?limit=2")
+        fragments.fragment_cache().clear()
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.client.get("/api/recipes/?limit=10")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(small_page), len(large_page))
+        self.assertTrue(all(
+            item["is_favorite"] for item in response.data["results"]))
+
+    def test_ordering_by_precomputed_scores(self):
+        reader = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass")
+        old, fresh, unrated = [
+            Recipe.objects.create(
+                author=self.user, name=f"Рецепт {number}", text="Описание",
+                cooking_time=15, image=self.recipe.image.name)
+            for number in range(3)
+        ]
+        week_ago = timezone.now() - timedelta(days=7)
+        for user in (self.user, reader):
+            FavoriteRecipe.objects.create(user=user, recipe=old)
+        FavoriteRecipe.objects.filter(recipe=old).update(created_at=week_ago)
+        ShoppingCartRecipe.objects.filter(recipe=old).update(
+            created_at=week_ago)
+        scores.refresh(full=True, now=timezone.now() - timedelta(hours=1))
+
+        FavoriteRecipe.objects.create(user=self.user, recipe=fresh)
+        FavoriteRecipe.objects.filter(recipe=fresh).update(
+            created_at=timezone.now() - timedelta(minutes=1))
+        call_command("compute_recipe_scores", stdout=StringIO())
+
+        def ranking(ordering):
+            response = self.client.get(f"/api/recipes/?ordering={ordering}")
+            return [item["id"] for item in response.data["results"]]
+
+        self.assertEqual(ranking("popular")[:2], [old.id, fresh.id])
+        self.assertEqual(ranking("trending")[:2], [fresh.id, old.id])
+        self.assertIn(unrated.id, ranking("popular")[2:])
+
+        # Короткий период: 2 ** ((t - EPOCH) / half_life) не влез бы во float
+        with override_settings(RECIPE_SCORES={"HALF_LIFE_HOURS": 1}):
+            scores.refresh(full=True)
+        self.assertEqual(ranking("trending")[:2], [fresh.id, old.id])
+        self.assertAlmostEqual(
+            scores.log2_add(scores.log2_add(None, 3.0), 3.0), 4.0)
+
+        # popular тоже затухает: старые события уступают свежим
+        with override_settings(
+                RECIPE_SCORES={"POPULAR_HALF_LIFE_HOURS": 24}):
+            scores.refresh(full=True)
+        self.assertEqual(ranking("popular")[:2], [fresh.id, old.id])
+        self.assertEqual(
+            self.client.get("/api/recipes/?ordering=random").status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+    def test_feed_follows_subscriptions(self):
+        reader = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass")
+        self.client.force_authenticate(reader)
+        Subscription.objects.create(subscriber=reader, author=self.user)
+        fresh = Recipe.objects.create(
+            author=self.user, name="Новый", text="Описание",
+            cooking_time=15, image=self.recipe.image.name)
+
+        response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            [fresh.id, self.recipe.id])
+        self.assertIsNone(response.data["next"])
+
+        with override_settings(RECIPE_FEED={"FANOUT_LIMIT": 0}):
+            celebrity = Recipe.objects.create(
+                author=self.user, name="Без раскладки", text="Описание",
+                cooking_time=15, image=self.recipe.image.name)
+            response = self.client.get("/api/recipes/feed/")
+            walked = []
+            url = "/api/recipes/feed/?cursor=&limit=1"
+            while url:
+                page = self.client.get(url).data
+                self.assertEqual(len(page["results"]), 1)
+                walked.extend(item["id"] for item in page["results"])
+                url = page["next"]
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            [celebrity.id, fresh.id, self.recipe.id])
+        self.assertEqual(walked, [celebrity.id, fresh.id, self.recipe.id])
+
+        # Автор опустился до FANOUT_LIMIT: рецепт без раскладки остаётся
+        second = User.objects.create_user(
+            email="second@example.com", username="second", password="pass")
+        Subscription.objects.create(subscriber=second, author=self.user)
+        with override_settings(RECIPE_FEED={"FANOUT_LIMIT": 1}):
+            late = Recipe.objects.create(
+                author=self.user, name="Поздний", text="Описание",
+                cooking_time=15, image=self.recipe.image.name)
+            Subscription.objects.filter(subscriber=second).delete()
+            response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]],
+            [late.id, celebrity.id, fresh.id, self.recipe.id])
+
+        Subscription.objects.filter(subscriber=reader).delete()
+        response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(response.data["results"], [])
+
+    def test_anonymous_responses_are_cached(self):
+        other = Recipe.objects.create(
+            author=User.objects.create_user(
+                email="other@example.com", username="other", password="pass"),
+            name="Чужой рецепт", text="Описание",
+            cooking_time=15, image=self.recipe.image.name)
+        anonymous = APIClient()
+        detail = f"/api/recipes/{self.recipe.id}/"
+        first = anonymous.get("/api/recipes/?limit=5&page=1").data
+        anonymous.get(detail)
+        anonymous.get(f"/api/recipes/{other.id}/")
+        with CaptureQueriesContext(connection) as queries:
+            again = anonymous.get("/api/recipes/?page=1&limit=5").data
+            anonymous.get(detail)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(again, first)
+
+        self.client.patch(detail, {
+            "name": "Новое имя",
+            "ingredients": [{"id": self.ingredient.id, "amount": 5}],
+        }, format="json")
+        self.assertEqual(anonymous.get(detail).data["name"], "Новое имя")
+        self.assertEqual(
+            anonymous.get("/api/recipes/?limit=5&page=1")
+            .data["results"][1]["name"], "Новое имя")
+        with CaptureQueriesContext(connection) as queries:
+            anonymous.get(f"/api/recipes/{other.id}/")
+        self.assertEqual(len(queries), 0)
+
+        self.user.first_name = "Автор"
+        self.user.save()
+        self.assertEqual(
+            anonymous.get(detail).data["author"]["first_name"], "Автор")
+
+        fresh = Recipe.objects.create(
+            author=self.user, name="Свежий", text="Описание",
+            cooking_time=15, image=self.recipe.image.name)
+        self.assertEqual(
+            anonymous.get("/api/recipes/?limit=5&page=1")
+            .data["results"][0]["id"], fresh.id)
+        fresh_id = fresh.id
+        fresh.delete()
+        self.assertEqual(
+            anonymous.get(f"/api/recipes/{fresh_id}/").status_code,
+            status.HTTP_404_NOT_FOUND)
+
+    def test_recipe_fragments_keep_user_flags(self):
+        reader = User.objects.create_user(
+            email="reader@example.com", username="reader", password="pass")
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        detail = f"/api/recipes/{self.recipe.id}/"
+        self.assertTrue(self.client.get(detail).data["is_favorite"])
+
+        self.client.force_authenticate(reader)
+        with mock.patch.object(
+                RecipeIngredientSerializer, "to_representation") as render:
+            data = self.client.get("/api/recipes/").data["results"][0]
+        render.assert_not_called()
+        self.assertFalse(data["is_favorite"])
+        self.assertFalse(data["author"]["is_subscribed"])
+        Subscription.objects.create(subscriber=reader, author=self.user)
+        self.assertTrue(
+            self.client.get(detail).data["author"]["is_subscribed"])
+
+        self.ingredient.name = "Морская соль"
+        self.ingredient.save()
+        self.user.last_name = "Повар"
+        self.user.save()
+        data = self.client.get(detail).data
+        self.assertEqual(data["ingredients"][0]["name"], "Морская соль")
+        self.assertEqual(data["author"]["last_name"], "Повар")
+
+    def test_conditional_get(self):
+        detail = f"/api/recipes/{self.recipe.id}/"
+        for url in (detail, "/api/recipes/?limit=5",
+                    f"/api/ingredients/{self.ingredient.id}/"):
+            first = self.client.get(url)
+            self.assertIn("ETag", first)
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        etag = self.client.get(detail)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["is_favorite"])
+
+        etag = response["ETag"]
+        self.user.first_name = "Автор"
+        self.user.save()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        anonymous = APIClient()
+        etag = anonymous.get(detail)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = anonymous.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+    def test_image_renditions(self):
+        payload = {
+            "name": "С фото", "text": "Описание", "cooking_time": 10,
+            "image": get_base64_image(),
+            "ingredients": [{"id": self.ingredient.id, "amount": 5}],
+        }
+        with override_settings(IMAGE_RENDITIONS={"EXECUTOR": "sync"}):
+            with self.captureOnCommitCallbacks() as callbacks:
+                created = self.client.post(
+                    "/api/recipes/", payload, format="json")
+            self.assertIsNone(created.data["image_renditions"])
+            for callback in callbacks:
+                callback()
+
+        detail = self.client.get(f"/api/recipes/{created.data['id']}/")
+        renditions_data = detail.data["image_renditions"]
+        self.assertEqual(
+            set(renditions_data), {"thumbnail", "card", "full"})
+        self.assertEqual(set(renditions_data["card"]), {"webp", "jpeg"})
+        recipe = Recipe.objects.get(id=created.data["id"])
+        thumbnail = recipe.image_renditions["thumbnail"]["webp"]
+        with Image.open(f"{settings.MEDIA_ROOT}/{thumbnail}") as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertLessEqual(max(image.size), 160)
+
+        # Пул процесса строит версии так же, как синхронный вызов
+        options = renditions.rendition_options()
+        built = renditions._executor("thread", 1).submit(
+            renditions.render, self.recipe.image.name, options).result()
+        self.assertTrue(built["full"]["jpeg"].endswith("full.jpeg"))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_media_is_content_addressed(self):
+        url = f"/api/recipes/{self.recipe.id}/"
+        payload = {
+            "image": get_base64_image(),
+            "ingredients": [{"id": self.ingredient.id, "amount": 5}],
+        }
+        first = self.client.patch(url, payload, format="json")
+        name = Recipe.objects.get(id=self.recipe.id).image.name
+        path = f"{settings.MEDIA_ROOT}/{name}"
+        written = os.stat(path).st_ino
+        self.client.patch(url, payload, format="json")
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipe.id).image.name, name)
+        self.assertEqual(os.stat(path).st_ino, written)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        orphan = storage.content_storage.save(
+            "recipes/images/orphan.gif", ContentFile(b"GIF89a orphan"))
+        self.assertTrue(storage.content_storage.exists(orphan))
+        self.assertEqual(storage.collect_garbage(min_age=3600), [])
+        removed = storage.collect_garbage(min_age=0)
+        self.assertEqual(removed, [orphan])
+        self.assertFalse(storage.content_storage.exists(orphan))
+        self.assertTrue(storage.content_storage.exists(name))
+
+    def test_page_count_is_cached(self):
+        self.client.get("/api/recipes/")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/recipes/?page=1")
+        self.assertEqual(response.data["count"], 1)
+        self.assertFalse(any(
+            "COUNT(" in query["sql"] for query in queries.captured_queries))
+
+    @override_settings(PAGINATION_COUNT={'CACHE_TIMEOUT': 0})
+    def test_page_count_without_cache(self):
+        self.client.get("/api/recipes/")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/api/recipes/")
+        self.assertTrue(any(
+            "COUNT(" in query["sql"] for query in queries.captured_queries))
+
+    def test_filter_is_favorited(self):
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get("/api/recipes/?is_favorited=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+        response = self.client.get("/api/recipes/?is_favorited=0")
+        self.assertEqual(response.data["count"], 0)
+
+    def test_marks_follow_changes(self):
+        detail = f"/api/recipes/{self.recipe.id}/"
+        self.assertFalse(self.client.get(detail).data["is_favorite"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(detail + "add-to-favorites/")
+        response = self.client.post(detail + "add-to-favorites/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(self.client.get(detail).data["is_favorite"])
+        self.assertEqual(
+            self.client.get("/api/recipes/?is_favorited=1").data["count"], 1)
+        self.assertEqual(
+            marks.recipe_ids(
+                mock.Mock(spec=["user"], user=self.user), marks.FAVORITES),
+            {self.recipe.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(detail + "remove-from-favorites/")
+        self.assertFalse(self.client.get(detail).data["is_favorite"])
+        self.assertEqual(
+            self.client.get("/api/recipes/?is_favorited=1").data["count"], 0)
+
+        # Откат не оставляет в кэше рецепт, которого нет в базе
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+            raise DatabaseError
+        self.assertFalse(self.client.get(detail).data["is_favorite"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ShoppingCartRecipe.objects.create(
+                user=self.user, recipe=self.recipe)
+        with override_settings(RECIPE_MARKS={"FILTER_LIMIT": 0}):
+            response = self.client.get("/api/recipes/?is_in_shopping_cart=1")
+        self.assertEqual(response.data["count"], 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """Бюджет SQL-запросов для эндпоинтов рецептов и ингредиентов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors, cls.recipes, cls.catalogue = seed_dataset()
+        cls.user = User.objects.create_user(
+            email="budget@example.com",
+            username="budget",
+            password="testpassword"
+        )
+        seed_user_activity(cls.user, cls.authors, cls.recipes)
+        cls.token = Token.objects.create(user=cls.user)
+        cls.own_recipe = Recipe.objects.create(
+            author=cls.user,
+            name="Свой рецепт",
+            text="Описание рецепта",
+            cooking_time=15,
+            image='recipes/images/seed.jpg',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def recipe_payload(self):
+        return {
+            "name": "Новый рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+            "image": get_base64_image(),
+            "ingredients": [
+                {"id": ingredient.id, "amount": 5}
+                for ingredient in self.catalogue[:5]
+            ],
+        }
+
+    def test_recipe_list(self):
+        # Холодный кэш: токен, count, подписки и множества избранного
+        with self.assertQueryBudget(8):
+            response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertQueryBudget(4):
+            response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_list_warm_fragments(self):
+        # Все карточки из кэша фрагментов: ингредиенты не читаются
+        self.client.get("/api/recipes/")
+        with self.assertQueryBudget(2) as log:
+            response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        table = RecipeIngredient._meta.db_table
+        self.assertFalse(
+            any(table in sql for _, sql in log.queries), log.report())
+
+    def test_recipe_list_anonymous(self):
+        self.client.credentials()
+        with self.assertQueryBudget(5):
+            response = self.client.get("/api/recipes/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_list_filtered(self):
+        with self.assertQueryBudget(9):
+            response = self.client.get(
+                "/api/recipes/?is_favorited=1&is_in_shopping_cart=1"
+                f"&author={self.authors[0].id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_list_ordered_by_score(self):
+        call_command("compute_recipe_scores", "--full", stdout=StringIO())
+        with self.assertQueryBudget(8):
+            response = self.client.get("/api/recipes/?ordering=trending")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFlatQueryCount("/api/recipes/?ordering=popular", "limit")
+
+    def test_recipe_list_is_flat(self):
+        self.assertFlatQueryCount("/api/recipes/", "limit")
+        self.assertFlatQueryCount("/api/recipes/?is_favorited=1", "limit")
+
+    def test_recipe_cursor_walk_is_stable(self):
+        seen = []
+        url = "/api/recipes/?cursor=&limit=40"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+            if len(seen) == 40:
+                # Новый рецепт попадает в начало ленты и не сдвигает курсор
+                Recipe.objects.create(
+                    author=self.user, name="Свежий", text="Описание",
+                    cooking_time=10, image='recipes/images/seed.jpg')
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), Recipe.objects.count() - 1)
+
+    def test_recipe_cursor_page_cost(self):
+        self.assertFlatQueryCount("/api/recipes/?cursor=", "limit")
+        first = self.client.get("/api/recipes/?cursor=&limit=100")
+        _, first_page = self.count_queries("get", first.data["next"])
+        _, deep_page = self.count_queries(
+            "get", self.client.get(first.data["next"]).data["next"])
+        self.assertEqual(len(first_page), len(deep_page))
+
+    def test_recipe_invalid_cursor(self):
+        response = self.client.get("/api/recipes/?cursor=broken")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_feed(self):
+        with self.assertQueryBudget(8):
+            response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFlatQueryCount("/api/recipes/feed/?cursor=", "limit")
+
+    def test_feed_walk_matches_subscriptions(self):
+        expected = list(Recipe.objects.filter(
+            author__subscribers__subscriber=self.user
+        ).order_by("-created_at", "-id").values_list("id", flat=True))
+        seen = []
+        url = "/api/recipes/feed/?limit=25"
+        while url:
+            response = self.client.get(url)
+            seen.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        self.assertTrue(expected)
+        self.assertEqual(seen, expected)
+
+    def test_recipe_detail(self):
+        with self.assertQueryBudget(7):
+            response = self.client.get(f"/api/recipes/{self.recipes[0].id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_short_link(self):
+        with self.assertQueryBudget(4):
+            response = self.client.get(
+                f"/api/recipes/{self.recipes[0].id}/short-link/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_favorite_toggle(self):
+        url = f"/api/recipes/{self.recipes[-1].id}/"
+        with self.assertQueryBudget(4):
+            response = self.client.post(url + "add-to-favorites/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["id"], self.recipes[-1].id)
+        with self.assertQueryBudget(2):
+            response = self.client.post(url + "add-to-favorites/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertQueryBudget(2):
+            response = self.client.delete(url + "remove-from-favorites/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        with self.assertQueryBudget(2):
+            response = self.client.delete(url + "remove-from-favorites/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            Recipe.objects.get(id=self.recipes[-1].id).favorites_count, 0)
+
+        missing = f"/api/recipes/{Recipe.objects.count() + 1000}/"
+        self.assertEqual(
+            self.client.post(missing + "add-to-favorites/").status_code,
+            status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.client.delete(missing + "remove-from-favorites/").status_code,
+            status.HTTP_404_NOT_FOUND)
+
+    def test_shopping_cart_toggle(self):
+        url = f"/api/recipes/{self.recipes[-2].id}/"
+        with self.assertQueryBudget(5):
+            response = self.client.post(url + "add-to-shopping-cart/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertQueryBudget(4):
+            response = self.client.delete(
+                url + "remove-from-shopping-cart/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_download_shopping_list(self):
+        with self.assertQueryBudget(3):
+            response = self.client.get("/api/recipes/shopping-cart/")
+            b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_create(self):
+        with self.assertQueryBudget(19):
+            response = self.client.post(
+                "/api/recipes/", self.recipe_payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_recipe_update(self):
+        with self.assertQueryBudget(22):
+            response = self.client.patch(
+                f"/api/recipes/{self.own_recipe.id}/",
+                self.recipe_payload(), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_delete(self):
+        with self.assertQueryBudget(12):
+            response = self.client.delete(
+                f"/api/recipes/{self.own_recipe.id}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_ingredient_list(self):
+        # Первый запрос воркера загружает каталог в память
+        self.client.get("/api/ingredients/")
+        with self.assertQueryBudget(1):
+            response = self.client.get("/api/ingredients/?name=Ингр")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_ingredient_detail(self):
+        self.client.get("/api/ingredients/")
+        with self.assertQueryBudget(1):
+            response = self.client.get(
+                f"/api/ingredients/{self.catalogue[0].id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,174 @@
+"""
+Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается по лентам подписчиков (TimelineEntry)
+одним INSERT ... SELECT из подписок. Авторы, у которых подписчиков
+больше FANOUT_LIMIT, не раскладываются: их рецепты читаются при запросе
+ленты и сливаются со строками ленты по (published_at, id). Когда число
+подписчиков опускается до FANOUT_LIMIT, последние BACKFILL рецептов
+автора раскладываются заново, иначе они пропали бы из обоих потоков.
+"""
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Q
+
+from users.models import Subscription
+
+from .models import Recipe, TimelineEntry
+
+User = get_user_model()
+
+DEFAULTS = {
+    'FANOUT_LIMIT': 5000,
+    'BACKFILL': 50,
+}
+
+PUBLISH_SQL = '''
+    INSERT INTO {timeline} (user_id, recipe_id, published_at)
+    SELECT subscription.subscriber_id, %s, %s
+    FROM {subscriptions} AS subscription
+    WHERE subscription.author_id = %s
+      AND (SELECT subscribers_count FROM {users} WHERE id = %s) <= %s
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+'''
+
+BACKFILL_SQL = '''
+    INSERT INTO {timeline} (user_id, recipe_id, published_at)
+    SELECT subscription.subscriber_id, recipe.id, recipe.created_at
+    FROM {subscriptions} AS subscription
+    JOIN {users} AS author ON author.id = subscription.author_id
+    JOIN (
+        SELECT id, author_id, created_at, ROW_NUMBER() OVER (
+            PARTITION BY author_id ORDER BY created_at DESC, id DESC
+        ) AS position
+        FROM {recipes}
+    ) AS recipe ON recipe.author_id = subscription.author_id
+    WHERE recipe.position <= %s
+      AND author.subscribers_count <= %s
+      AND {where}
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+'''
+
+
+def feed_options():
+    return {**DEFAULTS, **getattr(settings, 'RECIPE_FEED', {})}
+
+
+def _execute(template, params, where='TRUE'):
+    sql = template.format(
+        timeline=TimelineEntry._meta.db_table,
+        subscriptions=Subscription._meta.db_table,
+        users=User._meta.db_table,
+        recipes=Recipe._meta.db_table,
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def publish(recipe):
+    """Разложить новый рецепт по лентам подписчиков автора"""
+    _execute(PUBLISH_SQL, [
+        recipe.id, recipe.created_at, recipe.author_id,
+        recipe.author_id, feed_options()['FANOUT_LIMIT'],
+    ])
+
+
+def follow(subscriber_id, author_id):
+    """Подписка: последние рецепты автора попадают в ленту"""
+    options = feed_options()
+    _execute(
+        BACKFILL_SQL,
+        [options['BACKFILL'], options['FANOUT_LIMIT'],
+         subscriber_id, author_id],
+        'subscription.subscriber_id = %s AND subscription.author_id = %s',
+    )
+
+
+def unfollow(subscriber_id, author_id):
+    """
+    Отписка: рецепты автора уходят из ленты. Если подписчиков
+    осталось ровно FANOUT_LIMIT, рецепты, которые читались при запросе,
+    раскладываются по лентам оставшихся подписчиков
+    """
+    TimelineEntry.objects.filter(
+        user_id=subscriber_id, recipe__author_id=author_id).delete()
+    options = feed_options()
+    _execute(
+        BACKFILL_SQL,
+        [options['BACKFILL'], options['FANOUT_LIMIT'],
+         author_id, options['FANOUT_LIMIT']],
+        'subscription.author_id = %s AND author.subscribers_count = %s',
+    )
+
+
+@transaction.atomic
+def rebuild(user_ids=None):
+    """Пересобрать ленты из подписок (например, после смены лимитов)"""
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user__in=user_ids)
+    entries.delete()
+    if user_ids is not None and not user_ids:
+        return 0
+    options = feed_options()
+    params = [options['BACKFILL'], options['FANOUT_LIMIT']]
+    if user_ids is None:
+        _execute(BACKFILL_SQL, params)
+    else:
+        _execute(
+            BACKFILL_SQL,
+            params + list(user_ids),
+            'subscription.subscriber_id IN ({})'.format(
+                ', '.join(['%s'] * len(user_ids))),
+        )
+    return entries.count()
+
+
+def _before(position, date_field, id_field):
+    """Условие «строго после курсора» при порядке (-date, -id)"""
+    published_at, pk = position
+    return Q(**{f'{date_field}__lte': published_at}) & (
+        Q(**{f'{date_field}__lt': published_at})
+        | Q(**{f'{id_field}__lt': pk})
+    )
+
+
+def page_keys(user, position, limit):
+    """
+    Ключи (published_at, recipe_id) страницы ленты по убыванию:
+    диапазон по индексу ленты плюс рецепты авторов без раскладки
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    direct = Recipe.objects.filter(
+        author__in=Subscription.objects.filter(
+            subscriber=user,
+            author__subscribers_count__gt=feed_options()['FANOUT_LIMIT'],
+        ).values('author'))
+    if position is not None:
+        entries = entries.filter(
+            _before(position, 'published_at', 'recipe_id'))
+        direct = direct.filter(_before(position, 'created_at', 'id'))
+
+    read_time = list(direct.order_by('-created_at', '-id').values_list(
+        'created_at', 'id')[:limit])
+    # Автор мог перейти FANOUT_LIMIT после раскладки: его строки ленты
+    # дублируют read_time и укоротили бы страницу, поэтому исключаются
+    fanned_out = entries.exclude(
+        recipe_id__in=[pk for _, pk in read_time]
+    ).order_by('-published_at', '-recipe_id').values_list(
+        'published_at', 'recipe_id')[:limit]
+
+    keys = []
+    seen = set()
+    for key in heapq.merge(fanned_out, read_time, reverse=True):
+        if key[1] in seen:
+            continue
+        seen.add(key[1])
+        keys.append(key)
+        if len(keys) == limit:
+            break
+    return keys
@@ -0,0 +1,130 @@
+"""
+Добавление рецепта в избранное / корзину и удаление из них одним
+SQL-выражением вместо get_object_or_404 + проверки + записи + чтения.
+
+Добавление — INSERT ... ON CONFLICT DO NOTHING RETURNING: повторное
+нажатие (в том числе одновременное) ничего не вставляет и отличается
+от первого пустым RETURNING. В PostgreSQL вставка и чтение полей
+рецепта для ответа объединены в одно выражение (WITH ... INSERT);
+в остальных СУБД (SQLite >= 3.35) поля рецепта читаются отдельно.
+
+Удаление — DELETE ... RETURNING; только если строки не было, ещё одним
+запросом выясняется, существует ли рецепт (404 или 400).
+
+Выражения обходят ORM, поэтому сигналы моделей (счётчики, итоги списка
+покупок, множества marks.py, ETag пользователя) отправляются здесь же,
+в той же транзакции.
+"""
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.utils import timezone
+
+from . import marks
+from .models import Recipe
+
+# Поля рецепта, которые нужны ответу (BaseRecipeActionSerializer)
+RECIPE_FIELDS = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
+
+ADD_WITH_RECIPE_SQL = '''
+    WITH recipe AS (
+        SELECT {columns} FROM {recipes} WHERE id = %s
+    ), added AS (
+        INSERT INTO {table} (user_id, recipe_id, created_at)
+        SELECT %s, recipe.id, %s FROM recipe
+        ON CONFLICT (user_id, recipe_id) DO NOTHING
+        RETURNING id
+    )
+    SELECT recipe.*, (SELECT id FROM added) AS added_id FROM recipe
+'''
+
+ADD_SQL = '''
+    INSERT INTO {table} (user_id, recipe_id, created_at)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (user_id, recipe_id) DO NOTHING
+    RETURNING id
+'''
+
+REMOVE_SQL = '''
+    DELETE FROM {table} WHERE user_id = %s AND recipe_id = %s
+    RETURNING id
+'''
+
+
+def _add_with_recipe(model, user_id, recipe_id, created_at):
+    sql = ADD_WITH_RECIPE_SQL.format(
+        columns=', '.join(
+            Recipe._meta.get_field(name).column for name in RECIPE_FIELDS),
+        recipes=Recipe._meta.db_table,
+        table=model._meta.db_table,
+    )
+    rows = list(Recipe.objects.raw(sql, [recipe_id, user_id, created_at]))
+    if not rows:
+        return None, None
+    return rows[0], rows[0].added_id
+
+
+def _add_after_recipe(model, user_id, recipe_id, created_at):
+    try:
+        recipe = Recipe.objects.only(*RECIPE_FIELDS).get(id=recipe_id)
+    except Recipe.DoesNotExist:
+        return None, None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            ADD_SQL.format(table=model._meta.db_table),
+            [user_id, recipe_id, created_at])
+        row = cursor.fetchone()
+    return recipe, row and row[0]
+
+
+def add(kind, user_id, recipe_id):
+    """
+    (рецепт, новая строка). Рецепта нет — (None, None);
+    рецепт уже был добавлен — (рецепт, None)
+    """
+    model = marks.MODELS[kind]
+    now = timezone.now()
+    created_at = connection.ops.adapt_datetimefield_value(now)
+    insert = (
+        _add_with_recipe if connection.vendor == 'postgresql'
+        else _add_after_recipe
+    )
+    with transaction.atomic(savepoint=False):
+        recipe, entry_id = insert(model, user_id, recipe_id, created_at)
+        if entry_id is None:
+            return recipe, None
+        entry = model(
+            id=entry_id, user_id=user_id, recipe=recipe, created_at=now)
+        entry._state.adding = False
+        entry._state.db = connection.alias
+        post_save.send(
+            sender=model, instance=entry, created=True,
+            update_fields=None, raw=False, using=connection.alias)
+    return recipe, entry
+
+
+def remove(kind, user_id, recipe_id):
+    """
+    True — строка удалена, False — её не было,
+    None — рецепта не существует
+    """
+    model = marks.MODELS[kind]
+    with transaction.atomic(savepoint=False):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                REMOVE_SQL.format(table=model._meta.db_table),
+                [user_id, recipe_id])
+            row = cursor.fetchone()
+        if row is None:
+            if not Recipe.objects.filter(id=recipe_id).exists():
+                return None
+            return False
+        entry = model(id=row[0], user_id=user_id, recipe_id=recipe_id)
+        entry._state.adding = False
+        entry._state.db = connection.alias
+        # Строка уже удалена: обработчикам pre_delete (итоги списка
+        # покупок) нужен только состав рецепта, он на месте
+        for signal in (pre_delete, post_delete):
+            signal.send(
+                sender=model, instance=entry, using=connection.alias,
+                origin=entry)
+    return True
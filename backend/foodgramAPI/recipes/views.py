@@ -1,10 +1,12 @@
+import hashlib
 from http import HTTPStatus
-from collections import defaultdict
 
 # Сторонние библиотеки
-from django.db.models import Sum
-from django.http import FileResponse
-from django.shortcuts import get_object_or_404
+from django.db.models import Count, Max
+from django.core.cache import cache
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
@@ -12,8 +14,17 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 # Локальные импорты
+from api.conditional import ConditionalGetMixin
+from . import marks, response_cache, timeline, toggles
+from .catalogue import VERSION_KEY, get_catalogue
+from .exporters import EXPORT_FORMATS
 from .filters import RecipeFilter, IngredientFilter
-from .models import Recipe, Ingredient, FavoriteRecipe, ShoppingCartRecipe
+from .models import (
+    Recipe,
+    Ingredient,
+    ShoppingCartRecipe,
+    ShoppingListItem
+)
 from .paginations import RecipePaginator
 from .serializers import (
     IngredientSerializer,
@@ -24,7 +35,15 @@ from .serializers import (
 )
 
 
-class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
+def _recipe_id(pk):
+    """id рецепта из URL; нечисловой id — 404"""
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+class IngredientsViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для работы с ингредиентами
     """
@@ -34,8 +53,40 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """Список и поиск отдаются из каталога в памяти воркера"""
+        def render():
+            catalogue = get_catalogue()
+            name = request.query_params.get('name')
+            return Response(
+                catalogue.search(name) if name else catalogue.all())
+
+        return self.conditional_response(request, render)
+
+    def retrieve(self, request, *args, **kwargs):
+        def render():
+            try:
+                ingredient_id = int(kwargs[self.lookup_field])
+            except ValueError:
+                raise Http404
+            ingredient = get_catalogue().get(ingredient_id)
+            if ingredient is None:
+                raise Http404
+            return Response(ingredient)
 
-class RecipesViewSet(viewsets.ModelViewSet):
+        return self.conditional_response(request, render)
+
+    def get_validators(self, request):
+        """Ответ целиком определяется версией каталога: без запросов"""
+        etag = hashlib.md5('|'.join([
+            request.path,
+            request.query_params.urlencode(),
+            str(cache.get(VERSION_KEY)),
+        ]).encode()).hexdigest()
+        return quote_etag(etag), None
+
+
+class RecipesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Вьюсет для работы с рецептами: CRUD + действия "избранное", "список покупок"
     """
@@ -43,6 +94,9 @@ class RecipesViewSet(viewsets.ModelViewSet):
     pagination_class = RecipePaginator
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    updated_fields = ('updated_at', 'author__updated_at')
+    # Создание и удаление рецептов меняют версии областей списка
+    count_rows = False
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
@@ -54,11 +108,35 @@ class RecipesViewSet(viewsets.ModelViewSet):
             'create', 'update', 'partial_update',
             'destroy', 'add_to_shopping_cart',
             'remove_from_shopping_cart',
-            'download_shopping_list'
+            'download_shopping_list', 'feed'
         ]:
             return [IsAuthenticated()]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        return response_cache.cached_response(
+            request,
+            lambda: super(RecipesViewSet, self).list(
+                request, *args, **kwargs),
+            response_cache.list_scopes(request.query_params),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return response_cache.cached_response(
+            request,
+            lambda: super(RecipesViewSet, self).retrieve(
+                request, *args, **kwargs),
+        )
+
+    def get_etag_parts(self, request):
+        # Названия ингредиентов и порядок страниц списка меняются
+        # без изменения updated_at рецептов
+        parts = [cache.get(VERSION_KEY)]
+        if self.action == 'list':
+            parts += response_cache.scope_versions(
+                response_cache.list_scopes(request.query_params))
+        return parts
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -82,28 +160,13 @@ class RecipesViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Расширенный queryset с фильтрацией по избранному и списку покупок
+        Флаги избранного, списка покупок и подписки на автора
+        проверяются по множествам пользователя (marks.py,
+        users/following.py), а не в запросе рецептов. Ингредиенты
+        загружает RecipeReadSerializer только для рецептов, чьих
+        фрагментов нет в кэше
         """
-        queryset = super().get_queryset()
-        user = self.request.user
-
-        if not user.is_authenticated:
-            return queryset
-
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited == '1':
-            queryset = queryset.filter(favorites__user=user)
-        elif is_favorited == '0':
-            queryset = queryset.exclude(favorites__user=user)
-
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart == '1':
-            queryset = queryset.filter(shopping_cart__user=user)
-        elif is_in_shopping_cart == '0':
-            queryset = queryset.exclude(shopping_cart__user=user)
-
-        return queryset
+        return super().get_queryset().select_related('author')
 
     @action(detail=True, methods=['get'], url_path='short-link')
     def generate_short_url(self, request, pk=None):
@@ -121,41 +184,51 @@ class RecipesViewSet(viewsets.ModelViewSet):
         """
         Добавить рецепт в избранное
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        data = {'user': request.user.id, 'recipe': recipe.id}
-        serializer = FavoriteRecipeSerializer(
-            data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        return self._add_mark(
+            request, pk, marks.FAVORITES, FavoriteRecipeSerializer,
+            "Рецепт уже в избранном")
+
+    def _add_mark(self, request, pk, kind, serializer_class, duplicate):
+        """
+        Добавить рецепт в избранное или корзину одним INSERT ... ON
+        CONFLICT DO NOTHING (toggles.py): повтор, в том числе
+        одновременный, получает 400
+        """
+        recipe, entry = toggles.add(kind, request.user.pk, _recipe_id(pk))
+        if recipe is None:
+            raise Http404
+        if entry is None:
+            return Response(
+                {"detail": duplicate}, status=HTTPStatus.BAD_REQUEST)
+        serializer = serializer_class(entry, context={'request': request})
         return Response(serializer.data, status=HTTPStatus.CREATED)
 
+    def _remove_mark(self, request, pk, kind, missing):
+        """Удалить рецепт из избранного или корзины одним DELETE"""
+        removed = toggles.remove(kind, request.user.pk, _recipe_id(pk))
+        if removed is None:
+            raise Http404
+        if not removed:
+            return Response(
+                {"detail": missing}, status=HTTPStatus.BAD_REQUEST)
+        return Response(status=HTTPStatus.NO_CONTENT)
+
     @action(detail=True, methods=['delete'], url_path='remove-from-favorites')
     def remove_from_favorites(self, request, pk=None):
         """
         Удалить рецепт из избранного
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        deleted, _ = FavoriteRecipe.objects.filter(
-            user=request.user, recipe=recipe).delete()
-        if deleted == 0:
-            return Response(
-                {"detail": "Рецепт не найден в избранном"},
-                status=HTTPStatus.BAD_REQUEST
-            )
-        return Response(status=HTTPStatus.NO_CONTENT)
+        return self._remove_mark(
+            request, pk, marks.FAVORITES, "Рецепт не найден в избранном")
 
     @action(detail=True, methods=['post'], url_path='add-to-shopping-cart')
     def add_to_shopping_cart(self, request, pk=None):
         """
         Добавить рецепт в список покупок
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        data = {'user': request.user.id, 'recipe': recipe.id}
-        serializer = ShoppingCartRecipeSerializer(
-            data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=HTTPStatus.CREATED)
+        return self._add_mark(
+            request, pk, marks.CART, ShoppingCartRecipeSerializer,
+            "Рецепт уже в списке покупок")
 
     @action(detail=True, methods=['delete'],
             url_path='remove-from-shopping-cart')
@@ -163,21 +236,36 @@ class RecipesViewSet(viewsets.ModelViewSet):
         """
         Удалить рецепт из списка покупок
         """
-        recipe = get_object_or_404(Recipe, id=pk)
-        deleted, _ = ShoppingCartRecipe.objects.filter(
-            user=request.user, recipe=recipe
-        ).delete()
-        if deleted == 0:
-            return Response(
-                {"detail": "Рецепт не найден в списке покупок"},
-                status=HTTPStatus.BAD_REQUEST
-            )
-        return Response(status=HTTPStatus.NO_CONTENT)
+        return self._remove_mark(
+            request, pk, marks.CART, "Рецепт не найден в списке покупок")
+
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок, новые первыми.
+        Выдача по курсору (?cursor=, ?limit=), как у ленты рецептов
+        """
+        keys = self.paginator.paginate_keys(
+            request,
+            lambda position, limit: timeline.page_keys(
+                request.user, position, limit),
+        )
+        recipes = self.get_queryset().in_bulk([pk for _, pk in keys])
+        serializer = self.get_serializer(
+            [recipes[pk] for _, pk in keys if pk in recipes], many=True)
+        return self.paginator.get_paginated_response(serializer.data)
+
+    def perform_content_negotiation(self, request, force=False):
+        # В выгрузке списка покупок ?format= задаёт формат файла,
+        # а не рендерер DRF
+        if self.action == 'download_shopping_list':
+            force = True
+        return super().perform_content_negotiation(request, force)
 
     @action(detail=False, methods=['get'], url_path='shopping-cart')
     def download_shopping_list(self, request):
         """
-        Скачать список покупок в формате текстового файла
+        Скачать список покупок в формате txt, csv или pdf (?format=)
         """
         if not request.user.is_authenticated:
             return Response(
@@ -185,27 +273,51 @@ class RecipesViewSet(viewsets.ModelViewSet):
                 status=HTTPStatus.UNAUTHORIZED
             )
 
-        cart_items = ShoppingCartRecipe.objects.filter(
-            user=request.user).prefetch_related('recipe__recipe_ingredients')
-        if not cart_items.exists():
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": "Поддерживаемые форматы: "
+                          f"{', '.join(EXPORT_FORMATS)}"},
+                status=HTTPStatus.BAD_REQUEST
+            )
+
+        cart = ShoppingCartRecipe.objects.filter(
+            user=request.user
+        ).aggregate(
+            recipes=Count('id'),
+            last_added=Max('created_at'),
+            last_edited=Max('recipe__updated_at'),
+        )
+        if not cart['recipes']:
             return Response(
                 {"error": "Ваш список покупок пуст"},
                 status=HTTPStatus.NOT_FOUND
             )
 
-        ingredients_map = defaultdict(int)
-        for item in cart_items:
-            for ri in item.recipe.recipe_ingredients.all():
-                key = (ri.ingredient.name, ri.ingredient.measurement_unit)
-                ingredients_map[key] += ri.amount
-
-        content = ["Список покупок:\n"]
-        for (name, unit), amount in ingredients_map.items():
-            content.append(f"{name} ({unit}) — {amount}")
-
-        filename = "shopping_list.txt"
-        response = FileResponse(
-            "\n".join(content),
-            as_attachment=True,
-            filename=filename)
+        # Только ETag: удаление не самого нового рецепта не сдвигает
+        # max(дат), и Last-Modified дал бы клиенту устаревший 304.
+        # Удаление ловит число рецептов в ETag
+        last_modified = max(cart['last_added'], cart['last_edited'])
+        etag = quote_etag(hashlib.md5(
+            f"{request.user.id}:{file_format}:{cart['recipes']}:"
+            f"{last_modified.isoformat()}".encode()
+        ).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        rows = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        ).iterator()
+
+        content_type, exporter = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            exporter(rows), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_format}"')
+        response['ETag'] = etag
         return response
@@ -16,7 +16,9 @@ class CustomUserAdmin(UserAdmin):
         'last_name',
         'is_staff',
         'is_active',
-        'date_joined'
+        'date_joined',
+        'recipes_count',
+        'subscribers_count'
     )
     list_filter = ('is_staff', 'is_active', 'date_joined')
     search_fields = ('email', 'username', 'first_name', 'last_name')
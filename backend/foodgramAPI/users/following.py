@@ -0,0 +1,52 @@
+"""
+Множество id авторов, на которых подписан текущий пользователь.
+
+Загружается одним запросом на запрос API и хранится на объекте
+запроса, поэтому все UserSerializer (список пользователей, авторы
+рецептов, /me) проверяют is_subscribed по множеству. Между запросами
+множество лежит в кэше TIMEOUT секунд; подписка и отписка удаляют его
+(сигналы users/signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Subscription
+
+DEFAULTS = {
+    'TIMEOUT': 60,
+}
+
+
+def following_options():
+    return {**DEFAULTS, **getattr(settings, 'FOLLOWING_CACHE', {})}
+
+
+def _cache_key(user_id):
+    return f'users:following:{user_id}'
+
+
+def followed_author_ids(request):
+    """Пустое множество для анонимного пользователя и без запроса"""
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    if not hasattr(request, '_followed_author_ids'):
+        timeout = following_options()['TIMEOUT']
+        key = _cache_key(request.user.pk)
+        ids = cache.get(key) if timeout else None
+        if ids is None:
+            ids = frozenset(Subscription.objects.filter(
+                subscriber=request.user).values_list('author_id', flat=True))
+            if timeout:
+                cache.set(key, ids, timeout)
+        request._followed_author_ids = ids
+    return request._followed_author_ids
+
+
+def forget(user_id):
+    """Подписки пользователя изменились: сразу и после коммита"""
+    def delete():
+        cache.delete(_cache_key(user_id))
+
+    delete()
+    transaction.on_commit(delete)
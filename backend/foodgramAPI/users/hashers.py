@@ -0,0 +1,49 @@
+"""
+Хешеры паролей со стоимостью из settings.PASSWORD_HASHING.
+
+Имена алгоритмов совпадают со стандартными хешерами Django, поэтому
+старые хеши проверяются как прежде, а после смены стоимости или
+алгоритма (первый в PASSWORD_HASHERS) пароль перехешируется при
+следующем входе. Argon2 использует пакет argon2-cffi (requirements.txt).
+"""
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+from .hashing import hashing_options
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+
+    @property
+    def iterations(self):
+        return hashing_options()['PBKDF2_ITERATIONS']
+
+
+class TunableScryptPasswordHasher(ScryptPasswordHasher):
+
+    @property
+    def work_factor(self):
+        return hashing_options()['SCRYPT_WORK_FACTOR']
+
+    @property
+    def maxmem(self):
+        # Память scrypt — 128 * n * r байт; по умолчанию OpenSSL даёт 32 МБ
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+
+    @property
+    def time_cost(self):
+        return hashing_options()['ARGON2_TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return hashing_options()['ARGON2_MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return hashing_options()['ARGON2_PARALLELISM']
@@ -0,0 +1,107 @@
+"""
+Проверка и вычисление хешей паролей в ограниченном пуле потоков.
+
+Хеширование (PBKDF2, scrypt, Argon2) отпускает GIL, поэтому пул
+потоков занимает ядра, не блокируя остальные потоки воркера. Gunicorn
+запускает воркеры gthread (entrypoint.sh), и каждый процесс обслуживает
+несколько запросов сразу; пул ограничивает, сколько из них хешируют
+одновременно.
+
+Вход через API (users/views.py, TokenLoginView) проходит через
+admission(): в процессе одновременно не больше WORKERS + QUEUE входов;
+если место не освободилось за WAIT секунд, вход получает 429 вместо
+очереди, которая заняла бы все потоки воркера. WORKERS + QUEUE должно
+быть меньше --threads gunicorn. Остальные вызовы (вход в админку,
+смена пароля) не отклоняются, а ждут своей очереди в пуле.
+
+В пуле выполняются только чистые функции без обращений к базе;
+если хеш устарел (сменился алгоритм или стоимость), новый хеш
+вычисляется там же, а сохраняется в вызывающем потоке.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework.exceptions import Throttled
+
+DEFAULTS = {
+    'ALGORITHM': 'pbkdf2',
+    'PBKDF2_ITERATIONS': 600000,
+    'SCRYPT_WORK_FACTOR': 2 ** 14,
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 102400,
+    'ARGON2_PARALLELISM': 1,
+    'WORKERS': 2,
+    'QUEUE': 4,
+    'WAIT': 1.0,
+}
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def hashing_options():
+    return {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class LoginOverloaded(Throttled):
+    default_detail = 'Слишком много попыток входа, повторите позже'
+
+
+def _executor():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            options = hashing_options()
+            _pool = ThreadPoolExecutor(
+                max_workers=options['WORKERS'],
+                thread_name_prefix='password-hashing',
+            )
+            _slots = threading.BoundedSemaphore(
+                options['WORKERS'] + options['QUEUE'])
+        return _pool, _slots
+
+
+@contextmanager
+def admission():
+    """Место для входа через API; LoginOverloaded, если мест нет"""
+    slots = _executor()[1]
+    wait = hashing_options()['WAIT']
+    if not slots.acquire(timeout=wait):
+        raise LoginOverloaded(wait=max(1, round(wait)))
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def run(function, *args):
+    """Выполнить function в пуле и дождаться результата"""
+    pool = _executor()[0]
+    return pool.submit(function, *args).result()
+
+
+def check_encoded(password, encoded):
+    """(пароль верен, новый хеш или None)"""
+    outdated = []
+    valid = check_password(password, encoded, setter=outdated.append)
+    return valid, make_password(password) if valid and outdated else None
+
+
+def verify_password(user, password):
+    """
+    Проверить пароль пользователя. Устаревший хеш заменяется новым
+    (rehash при входе), как в AbstractBaseUser.check_password
+    """
+    valid, encoded = run(check_encoded, password, user.password)
+    if encoded is not None:
+        user.password = encoded
+        user.save(update_fields=['password'])
+    return valid
+
+
+def hash_password(password):
+    return run(make_password, password)
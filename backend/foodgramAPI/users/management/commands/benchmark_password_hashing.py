@@ -0,0 +1,81 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    check_password,
+    get_hasher,
+    make_password,
+)
+from django.core.management.base import BaseCommand
+
+from users import hashing
+
+PASSWORD = 'benchmark-Pass-123'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность входа: проверка пароля '
+        'стандартным PBKDF2 Django в потоке запроса и настроенным '
+        'хешером (PASSWORD_HASHING) в пуле с ограничением допуска. '
+        'База данных не используется'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=40)
+        parser.add_argument(
+            '--clients', type=int, default=8,
+            help='Одновременных запросов на вход',
+        )
+
+    def handle(self, *args, logins, clients, **options):
+        cores = os.cpu_count() or 1
+        stock = PBKDF2PasswordHasher()
+        stock_encoded = stock.encode(PASSWORD, stock.salt())
+        configured = get_hasher('default')
+        encoded = make_password(PASSWORD)
+        cost = {
+            key: value for key, value in hashing.hashing_options().items()
+            if key.startswith(configured.algorithm.split('_')[0].upper())
+        }
+        self.stdout.write(
+            f'Ядер: {cores}; до: {stock.algorithm} '
+            f'({stock.iterations} итераций), после: {configured.algorithm} '
+            f'{cost}'
+        )
+
+        before, _ = self._measure(
+            lambda: check_password(PASSWORD, stock_encoded, preferred=stock),
+            logins, clients,
+        )
+
+        def login():
+            with hashing.admission():
+                hashing.run(hashing.check_encoded, PASSWORD, encoded)
+
+        after, rejected = self._measure(login, logins, clients)
+        for title, rate in (('до', before), ('после', after)):
+            self.stdout.write(
+                f'{title}: {rate:.1f} входов/с, '
+                f'{rate / cores:.1f} входов/с на ядро'
+            )
+        self.stdout.write(f'Отклонено (429): {rejected}')
+
+    @staticmethod
+    def _measure(login, logins, clients):
+        rejected = 0
+
+        def attempt(_):
+            nonlocal rejected
+            try:
+                login()
+            except hashing.LoginOverloaded:
+                rejected += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(attempt, range(logins)))
+        elapsed = time.perf_counter() - started
+        return (logins - rejected) / elapsed, rejected
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_customuser_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_renditions',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Версии аватара'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 01:49
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_customuser_avatar_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=recipes.storage.get_content_storage, upload_to='users/avatars/', verbose_name='Аватар'),
+        ),
+    ]
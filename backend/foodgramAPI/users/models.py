@@ -2,6 +2,8 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils import timezone
+from recipes.storage import get_content_storage
+
 from .managers import AccountManager
 
 
@@ -33,15 +35,25 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     last_name = models.CharField('Фамилия', max_length=150, blank=True)
     date_joined = models.DateTimeField(
         'Дата регистрации', default=timezone.now)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
     is_active = models.BooleanField('Активный', default=True)
     is_staff = models.BooleanField('Персонал', default=False)
 
     avatar = models.ImageField(
         'Аватар',
-        upload_to='users/avatars/%Y/%m/%d/',
+        upload_to='users/avatars/',
+        storage=get_content_storage,
         blank=True,
         null=True,
     )
+    # Пути уменьшенных версий (см. recipes/renditions.py)
+    avatar_renditions = models.JSONField(
+        'Версии аватара', default=dict, editable=False)
+    # Счётчики поддерживаются сигналами (см. recipes/counters.py)
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов', default=0, editable=False)
+    subscribers_count = models.PositiveIntegerField(
+        'Подписчиков', default=0, editable=False)
 
     objects = AccountManager()
 
@@ -1,9 +1,12 @@
 from rest_framework.pagination import PageNumberPagination
 
+from api.pagination import CountingPaginator
+
 
 class AccountPagination(PageNumberPagination):
     """Класс пагинации для списка пользователей"""
 
+    django_paginator_class = CountingPaginator
     default_page_size = 6
     page_size = default_page_size
     max_page_size = 50
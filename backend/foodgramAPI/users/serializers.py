@@ -4,6 +4,9 @@ from rest_framework.validators import UniqueValidator
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 
+from recipes.renditions import rendition_urls
+
+from .following import followed_author_ids
 from .models import CustomUser, Subscription
 from .utils.validators import validate_user_identifier as validate_username
 
@@ -15,6 +18,7 @@ class UserAuthSerializer(serializers.Serializer):
 
     def validate(self, data):
         user = authenticate(
+            self.context.get('request'),
             email=data.get('email'),
             password=data.get('password')
         )
@@ -22,29 +26,29 @@ class UserAuthSerializer(serializers.Serializer):
             raise ValidationError("Неверные учетные данные")
         if not user.is_active:
             raise ValidationError("Учетная запись неактивна")
-        data['user'] = user
+        data['user'] = self.user = user
         return data
 
 
 class UserSerializer(serializers.ModelSerializer):
     """Основной сериализатор пользователя"""
     is_subscribed = serializers.SerializerMethodField()
+    avatar_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
         fields = [
             'id', 'email', 'username',
             'first_name', 'last_name',
-            'is_subscribed', 'avatar'
+            'is_subscribed', 'avatar', 'avatar_renditions'
         ]
 
+    def get_avatar_renditions(self, obj):
+        return rendition_urls(
+            obj.avatar, obj.avatar_renditions, self.context.get('request'))
+
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and obj.subscribers.filter(subscriber=request.user).exists()
-        )
+        return obj.pk in followed_author_ids(self.context.get('request'))
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -77,24 +81,59 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор подписок"""
+    """
+    Сериализатор подписок: автор, число его рецептов и превью рецептов.
+    recipes_preview приходит из Prefetch queryset, иначе превью
+    читается отдельным запросом; recipes_count — счётчик автора
+    """
+    id = serializers.ReadOnlyField(source='author.id')
     email = serializers.ReadOnlyField(source='author.email')
     username = serializers.ReadOnlyField(source='author.username')
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
+    avatar = serializers.ImageField(source='author.avatar', read_only=True)
+    avatar_renditions = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
+
+    default_recipes_limit = 3
 
     class Meta:
         model = Subscription
         fields = [
             'email', 'id', 'username',
             'first_name', 'last_name',
-            'is_subscribed', 'recipes_count'
+            'is_subscribed', 'avatar', 'avatar_renditions',
+            'recipes', 'recipes_count'
         ]
 
-    def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+    def get_avatar_renditions(self, obj):
+        return rendition_urls(
+            obj.author.avatar, obj.author.avatar_renditions,
+            self.context.get('request'))
 
     def get_is_subscribed(self, obj):
         return True
+
+    def get_recipes(self, obj):
+        request = self.context.get('request')
+        if hasattr(obj.author, 'recipes_preview'):
+            recipes = obj.author.recipes_preview
+        else:
+            limit = self.context.get(
+                'recipes_limit', self.default_recipes_limit)
+            recipes = obj.author.recipes.all()[:limit]
+        return [
+            {
+                'id': recipe.id,
+                'name': recipe.name,
+                'image': (
+                    request.build_absolute_uri(recipe.image.url)
+                    if request else recipe.image.url
+                ),
+                'image_renditions': rendition_urls(
+                    recipe.image, recipe.image_renditions, request),
+                'cooking_time': recipe.cooking_time
+            } for recipe in recipes
+        ]
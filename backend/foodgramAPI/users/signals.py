@@ -0,0 +1,67 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_token, invalidate_user
+from api.conditional import bump_user_state
+from recipes import renditions, response_cache, timeline
+from recipes.models import Recipe
+from recipes.counters import increment
+
+from . import following
+from .models import CustomUser, Subscription
+
+
+@receiver(post_save, sender=Subscription)
+def count_subscriber(sender, instance, created, **kwargs):
+    if created:
+        increment(CustomUser, instance.author_id, 'subscribers_count')
+        timeline.follow(instance.subscriber_id, instance.author_id)
+    following.forget(instance.subscriber_id)
+    bump_user_state(instance.subscriber_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def uncount_subscriber(sender, instance, **kwargs):
+    increment(CustomUser, instance.author_id, 'subscribers_count', -1)
+    timeline.unfollow(instance.subscriber_id, instance.author_id)
+    following.forget(instance.subscriber_id)
+    bump_user_state(instance.subscriber_id)
+
+
+# Поля автора, которые выводятся в карточке рецепта
+AUTHOR_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_renditions',
+}
+
+
+@receiver(post_save, sender=CustomUser)
+def evict_author_responses(sender, instance, created, update_fields,
+                           **kwargs):
+    """Изменение профиля автора сбрасывает ответы с его рецептами"""
+    if created or (
+            update_fields is not None
+            and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    response_cache.evict_recipes(Recipe.objects.filter(
+        author=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def build_avatar_renditions(sender, instance, **kwargs):
+    renditions.schedule(instance, 'avatar')
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(sender, instance, **kwargs):
+    """Выход из системы (в том числе djoser TokenDestroyView)"""
+    invalidate_token(instance.key, instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def revoke_cached_user(sender, instance, **kwargs):
+    """Смена пароля, деактивация и любые правки профиля"""
+    invalidate_user(instance.pk)
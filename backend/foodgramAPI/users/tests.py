@@ -1,11 +1,21 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
 import tempfile
+import threading
+from unittest import mock
 from PIL import Image
 from rest_framework.authtoken.models import Token
+from api import authentication
+from api.authentication import local_tokens
+from django.core.cache import caches
+from recipes import counters
+from recipes.fields import decode_base64_image
+from users import hashing
+from api.testing import QueryBudgetMixin, seed_dataset, seed_user_activity
 import base64
 import uuid
 
@@ -48,6 +58,132 @@ class SubscriptionTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
 
+class CachedTokenTests(QueryBudgetMixin, APITestCase):
+    """Токены из кэша отзываются сразу после выхода и смены данных"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            email="cached@example.com", username="cached",
+            password="testpassword")
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_lookup_is_cached(self):
+        def token_queries():
+            response, log = self.count_queries(
+                'get', "/api/users/current_user/")
+            self.assertEqual(response.data['email'], "cached@example.com")
+            return [sql for _, sql in log.queries if 'authtoken' in sql]
+
+        self.assertEqual(len(token_queries()), 1)
+        self.assertEqual(token_queries(), [])
+        # Память воркера пуста: пользователь из общего кэша
+        local_tokens.clear()
+        self.assertEqual(token_queries(), [])
+
+    def test_logout_revokes_token(self):
+        self.client.get("/api/users/current_user/")
+        self.client.post("/api/auth/token/logout/")
+        response = self.client.get("/api/users/current_user/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_revoke_cached_user(self):
+        self.client.get("/api/users/current_user/")
+        self.client.post("/api/users/me/password/", {
+            'current_password': 'testpassword',
+            'new_password': 'NewPass12345',
+        })
+        response = self.client.post("/api/users/me/password/", {
+            'current_password': 'NewPass12345',
+            'new_password': 'OtherPass12345',
+        })
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get("/api/users/current_user/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocation_reaches_other_workers(self):
+        self.client.get("/api/users/current_user/")
+        # Другой воркер: его память не трогаем, меняется только версия
+        # в общем кэше
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with mock.patch.object(local_tokens, 'delete_user'):
+            authentication.invalidate_user(self.user.pk)
+        response = self.client.get("/api/users/current_user/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_shared_cache_keeps_no_password(self):
+        self.client.get("/api/users/current_user/")
+        cached = caches['default'].get(f'auth:token:{self.token.key}')
+        self.assertEqual(cached.user_id, self.user.pk)
+        self.assertNotIn('password', cached.fields)
+
+    def test_silent_user_updates_refresh_cached_user(self):
+        self.client.get("/api/users/current_user/")
+        User.objects.filter(pk=self.user.pk).update(
+            avatar_renditions={'source': 'stale'})
+        counters.increment(User, self.user.pk, 'recipes_count')
+        _, log = self.count_queries('get', "/api/users/current_user/")
+        self.assertTrue(any('authtoken' in sql for _, sql in log.queries))
+
+
+class PasswordHashingTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="hash@example.com", username="hash",
+            password="testpassword")
+
+    def login(self):
+        return self.client.post("/api/auth/token/login/", {
+            'email': 'hash@example.com', 'password': 'testpassword'})
+
+    def test_login_rehashes_outdated_password(self):
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 1000}):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('auth_token', response.data)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        with self.settings(PASSWORD_HASHERS=[
+                'users.hashers.TunableScryptPasswordHasher',
+                'users.hashers.TunablePBKDF2PasswordHasher']):
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+
+        response = self.client.post("/api/auth/token/login/", {
+            'email': 'hash@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def no_free_slots(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        return mock.patch.object(
+            hashing, '_executor',
+            return_value=(hashing._executor()[0], slots))
+
+    def test_login_is_rejected_when_pool_is_full(self):
+        with self.no_free_slots(), self.settings(
+                PASSWORD_HASHING={'WAIT': 0.01}):
+            response = self.login()
+        self.assertEqual(
+            response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_admin_login_is_not_rejected(self):
+        self.user.is_staff = True
+        self.user.save()
+        with self.no_free_slots(), self.settings(
+                PASSWORD_HASHING={'WAIT': 0.01}):
+            response = self.client.post("/admin/login/", {
+                'username': 'hash@example.com', 'password': 'testpassword'})
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
 class ImageUploadTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -66,6 +202,55 @@ class ImageUploadTests(TestCase):
             url, data, format='json')  # Формат JSON для Base64
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_avatar_upload_is_validated(self):
+        url = "/api/users/me/avatar/"
+        not_image = base64.b64encode(b'<?php echo 1; ?>').decode()
+        response = self.client.put(
+            url, {'avatar': f'data:image/png;base64,{not_image}'},
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with self.settings(IMAGE_UPLOAD={'MAX_SIZE': 100}):
+            response = self.client.put(
+                url, {'avatar': get_base64_image()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Размер', response.data['detail'])
+
+        with self.settings(IMAGE_UPLOAD={'CHUNK': 8, 'SPOOL_SIZE': 16}):
+            response = self.client.put(
+                url, {'avatar': get_base64_image()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.avatar.name.endswith('.jpeg'))
+        with self.user.avatar.open('rb') as avatar:
+            self.assertEqual(
+                avatar.read(), base64.b64decode(
+                    get_base64_image().split(',')[1]))
+
+    def test_avatar_accepts_mime_wrapped_base64(self):
+        payload = get_base64_image().split(',')[1]
+        wrapped = '\r\n'.join(
+            payload[offset:offset + 76]
+            for offset in range(0, len(payload), 76)) + '\n'
+        with self.settings(IMAGE_UPLOAD={'CHUNK': 50}):
+            response = self.client.put(
+                "/api/users/me/avatar/",
+                {'avatar': f'data:image/jpeg;base64,{wrapped}'},
+                format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        with self.user.avatar.open('rb') as avatar:
+            self.assertEqual(avatar.read(), base64.b64decode(payload))
+
+    def test_image_format_needs_full_signature(self):
+        webp = base64.b64encode(b'RIFF\x00\x00\x00\x00WEBPVP8 ').decode()
+        with self.settings(IMAGE_UPLOAD={'CHUNK': 4}):
+            image = decode_base64_image(f'data:image/webp;base64,{webp}')
+        self.assertTrue(image.name.endswith('.webp'))
+        with self.settings(IMAGE_UPLOAD={'CHUNK': 0}):
+            with self.assertRaises(ImproperlyConfigured):
+                decode_base64_image(f'data:image/webp;base64,{webp}')
+
 
 class UserAccountTests(TestCase):
     def test_user_registration(self):
@@ -77,3 +262,116 @@ class UserAccountTests(TestCase):
         }
         response = self.client.post(url, data)  # Без аутентификации
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UserQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """Бюджет SQL-запросов для эндпоинтов пользователей и токенов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors, cls.recipes, _ = seed_dataset()
+        cls.user = User.objects.create_user(
+            email="budget@example.com",
+            username="budget",
+            password="testpassword"
+        )
+        seed_user_activity(cls.user, cls.authors, cls.recipes)
+        cls.token = Token.objects.create(user=cls.user)
+        cls.stranger = cls.authors[-1]
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_user_list(self):
+        with self.assertQueryBudget(5):
+            response = self.client.get("/api/users/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_list_is_flat(self):
+        self.assertFlatQueryCount("/api/users/", "per_page")
+
+    def test_user_detail(self):
+        with self.assertQueryBudget(4):
+            response = self.client.get(f"/api/users/{self.authors[0].id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_current_user(self):
+        with self.assertQueryBudget(2):
+            response = self.client.get("/api/users/current_user/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_registration(self):
+        self.client.credentials()
+        with self.assertQueryBudget(5):
+            response = self.client.post("/api/users/", {
+                'email': 'fresh@example.com',
+                'username': 'fresh',
+                'password': 'NewPass123'
+            })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_following(self):
+        with self.assertQueryBudget(4):
+            response = self.client.get(
+                "/api/users/following/?recipes_limit=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_following_is_flat(self):
+        self.assertFlatQueryCount("/api/users/following/", "per_page")
+
+    def test_following_payload(self):
+        response = self.client.get(
+            "/api/users/following/?per_page=50&recipes_limit=2")
+        self.assertEqual(len(response.data["results"]), 50)
+        for item in response.data["results"]:
+            author = User.objects.get(id=item["id"])
+            self.assertTrue(item["is_subscribed"])
+            self.assertEqual(item["recipes_count"], author.recipes.count())
+            self.assertEqual(
+                [recipe["id"] for recipe in item["recipes"]],
+                list(author.recipes.order_by(
+                    "-created_at", "-id").values_list("id", flat=True)[:2])
+            )
+
+    def test_subscribe_toggle(self):
+        url = f"/api/users/{self.stranger.id}/subscribe/"
+        with self.assertQueryBudget(7):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        with self.assertQueryBudget(6):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_avatar(self):
+        with self.assertQueryBudget(3):
+            response = self.client.put(
+                "/api/users/me/avatar/",
+                {'avatar': get_base64_image()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertQueryBudget(3):
+            response = self.client.delete("/api/users/me/avatar/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_change_password(self):
+        with self.assertQueryBudget(3):
+            response = self.client.post("/api/users/me/password/", {
+                'current_password': 'testpassword',
+                'new_password': 'NewPass12345',
+            })
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_token_login_logout(self):
+        self.client.credentials()
+        with self.assertQueryBudget(4):
+            response = self.client.post("/api/auth/token/login/", {
+                'email': 'budget@example.com',
+                'password': 'testpassword',
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.credentials(
+            HTTP_AUTHORIZATION='Token ' + response.data['auth_token'])
+        with self.assertQueryBudget(3):
+            response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
@@ -1,17 +1,17 @@
 # Импорт необходимых модулей
-from django.db.models import Count
-from django.core.files.base import ContentFile
-from django.contrib.auth.hashers import check_password
+from django.db.models import Prefetch
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-import base64
-import uuid
+from rest_framework.exceptions import ValidationError
+from djoser.views import TokenCreateView
 import logging
 
 # Локальные импорты
+from api.conditional import ConditionalGetMixin
+from .hashing import admission, hash_password, verify_password
 from .models import CustomUser, Subscription
 from .serializers import (
     UserAuthSerializer,
@@ -19,12 +19,21 @@ from .serializers import (
     UserCreateSerializer,
     SubscriptionSerializer
 )
+from recipes.fields import decode_base64_image
 from recipes.models import Recipe
 from .pagination import AccountPagination
 
 logger = logging.getLogger(__name__)
 
 
+class TokenLoginView(TokenCreateView):
+    """Вход djoser с ограничением одновременных входов (hashing.py)"""
+
+    def post(self, request, **kwargs):
+        with admission():
+            return super().post(request, **kwargs)
+
+
 class TokenAuthView(viewsets.ViewSet):
     """Управление токенами аутентификации"""
 
@@ -45,7 +54,7 @@ class TokenAuthView(viewsets.ViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserAccountViewSet(viewsets.ModelViewSet):
+class UserAccountViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """Контроллер для управления пользовательскими аккаунтами"""
     queryset = CustomUser.objects.all().order_by('-date_joined')
     pagination_class = AccountPagination
@@ -81,14 +90,14 @@ class UserAccountViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if not check_password(current_pass, user.password):
+        if not verify_password(user, current_pass):
             return Response(
                 {'detail': 'Неверный текущий пароль'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        user.set_password(new_pass)
-        user.save()
+        user.password = hash_password(new_pass)
+        user.save(update_fields=['password'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['put', 'delete'],
@@ -96,33 +105,25 @@ class UserAccountViewSet(viewsets.ModelViewSet):
     def profile_image(self, request):
         """Управление аватаром пользователя"""
         if request.method == 'PUT':
-            try:
-                image_data = request.data.get('avatar')
-                if not image_data:
-                    return Response(
-                        {'detail': 'Необходимо предоставить изображение'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                format, imgstr = image_data.split(';base64,')
-                ext = format.split('/')[-1]
-                filename = f'{uuid.uuid4()}.{ext}'
-
-                request.user.avatar.save(
-                    filename,
-                    ContentFile(base64.b64decode(imgstr)),
-                    save=True
-                )
+            image_data = request.data.get('avatar')
+            if not image_data:
                 return Response(
-                    {'avatar_url': request.user.avatar.url},
-                    status=status.HTTP_200_OK
+                    {'detail': 'Необходимо предоставить изображение'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-            except Exception as e:
-                logger.error(f'Ошибка загрузки изображения: {str(e)}')
+            try:
+                image = decode_base64_image(image_data)
+            except ValidationError as error:
                 return Response(
-                    {'detail': 'Ошибка обработки изображения'},
+                    {'detail': error.detail[0]},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            with image:
+                request.user.avatar.save(image.name, image, save=True)
+            return Response(
+                {'avatar_url': request.user.avatar.url},
+                status=status.HTTP_200_OK
+            )
 
         # DELETE обработка
         if not request.user.avatar:
@@ -130,7 +131,10 @@ class UserAccountViewSet(viewsets.ModelViewSet):
                 {'detail': 'Аватар отсутствует'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        request.user.avatar.delete()
+        # Файл может разделять другой пользователь: его удалит
+        # collect_media_garbage
+        request.user.avatar = None
+        request.user.save(update_fields=['avatar', 'updated_at'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'],
@@ -174,34 +178,33 @@ class UserAccountViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def following(self, request):
-        """Получение списка подписок"""
-        following_users = CustomUser.objects.filter(
-            subscribers__subscriber=request.user
-        ).annotate(
-            recipes_count=Count('recipes')
-        ).order_by('-subscription__created_at')
-
-        page = self.paginate_queryset(following_users)
-        serializer = UserSerializer(
-            page if page is not None else following_users,
+        """
+        Получение списка подписок с превью рецептов авторов.
+        Превью ограничено ?recipes_limit= через ROW_NUMBER() в одном
+        запросе Prefetch, число рецептов берётся из счётчика автора
+        """
+        try:
+            recipes_limit = max(int(request.query_params.get(
+                'recipes_limit', SubscriptionSerializer.default_recipes_limit
+            )), 0)
+        except ValueError:
+            recipes_limit = SubscriptionSerializer.default_recipes_limit
+
+        subscriptions = Subscription.objects.filter(
+            subscriber=request.user
+        ).select_related('author').prefetch_related(Prefetch(
+            'author__recipes',
+            queryset=Recipe.objects.order_by(
+                '-created_at', '-id')[:recipes_limit],
+            to_attr='recipes_preview'
+        )).order_by('-created_at', '-id')
+
+        page = self.paginate_queryset(subscriptions)
+        serializer = SubscriptionSerializer(
+            page if page is not None else subscriptions,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes_limit': recipes_limit}
         )
-
-        # Добавляем информацию о рецептах
-        response_data = []
-        for user in (page if page is not None else following_users):
-            user_data = serializer.data
-            recipes = Recipe.objects.filter(author=user)[:3]
-            user_data['recipes'] = [
-                {
-                    'id': recipe.id,
-                    'name': recipe.name,
-                    'image': request.build_absolute_uri(recipe.image.url),
-                    'cooking_time': recipe.cooking_time
-                } for recipe in recipes
-            ]
-            response_data.append(user_data)
-
-        return self.get_paginated_response(
-            response_data) if page else Response(response_data)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)